@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import Metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Sérialisation ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# le moteur json par défaut de plotly ('auto'), utilisé aussi par dash pour les réponses des callbacks,
+# choisit déjà orjson quand il est installé: seul le décodage des figures en cache est fait ici
+
+
+def dumps(figure):
+    """
+    Serializes a plotly figure with the configured plotly JSON engine.
+
+    Parameters:
+    - figure (plotly figure): The figure.
+
+    Returns:
+    bytes: The figure JSON, encoded in UTF-8.
+    """
+    return figure.to_json().encode()
+
+
+def loads(payload):
+    """
+    Parses a JSON document, with orjson when it is installed.
+
+    Parameters:
+    - payload (bytes or string): The JSON document.
+
+    Returns:
+    any: The parsed document.
+    """
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Fonctions ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def normalize(value):
+    """
+    Turns callback inputs (dropdown lists, data-store dict, ...) into a hashable value usable as a cache key.
+
+    Parameters:
+    - value (any): The value to normalize.
+
+    Returns:
+    hashable: Lists become tuples and dicts become tuples of sorted (key, value) pairs, recursively.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    return value
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Cache des figures ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+class FigureCache:
+    """
+    LRU cache of figures shared by every callback (and every user) of a worker.
+    Entries are the figures as plotly JSON dicts, decoded once when they are built, and are weighed by the size
+    of their JSON: the least recently used are evicted once max_bytes is exceeded.
+    A hit does not call pandas nor the figure builder, dash still encodes the returned dict into the response.
+
+    Parameters:
+    - max_bytes (int): Maximum total size of the stored figures, measured as JSON, in bytes.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """
+        Returns the figure stored under key, building and storing it on a miss.
+
+        Parameters:
+        - key (any): The builder name followed by its inputs, normalized with normalize.
+
+        - build (callable): Function without argument returning the plotly figure.
+
+        Returns:
+        dict: The figure as a plotly JSON dict, ready to be returned by a callback.
+        The dict is shared between requests and must not be modified in place (use a Patch).
+        """
+        key = normalize(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        Metrics.cache_hit(entry is not None)
+
+        if entry is not None:
+            return entry[0]
+
+        with Metrics.phase("build"):
+            figure = build()
+        with Metrics.phase("serialize"):
+            payload = dumps(figure)
+            figure = loads(payload)
+        self._store(key, figure, len(payload))
+        return figure
+
+    def _store(self, key, figure: dict, size: int):
+        # une figure plus grosse que le cache entier n'est pas conservée
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (figure, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns:
+        dict: Number of hits, misses, stored entries and JSON size of the stored figures, in bytes.
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "entries": len(self._entries),
+                    "bytes": self.size,
+                    "max_bytes": self.max_bytes}
+
+
+class LRUCache:
+    """
+    LRU cache of Python objects bounded by a number of entries, for intermediate results (decompositions, ...).
+
+    Parameters:
+    - maxsize (int): Maximum number of entries kept.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return normalize(key) in self._entries
+
+    def set(self, key, value):
+        key = normalize(key)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        """
+        Returns the value stored under key, building and storing it on a miss.
+
+        Parameters:
+        - key (any): The key, normalized with normalize.
+
+        - build (callable): Function without argument returning the value.
+
+        Returns:
+        any: The stored value.
+        """
+        key = normalize(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = build()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# cache partagé par tous les callbacks de get_callbacks, un par worker: la mémoire totale est multipliée
+# par le nombre de workers (DASHBIKE_FIGURE_CACHE_MB, en Mo)
+figures = FigureCache(max_bytes=int(os.environ.get("DASHBIKE_FIGURE_CACHE_MB", "128")) * 1024 * 1024)
@@ -0,0 +1,433 @@
+import os
+import json
+import urllib.request
+import numpy as np
+import pandas as pd
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Fichiers ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# jeu de données brut et sa version colonne déjà typée (modifiables par variables d'environnement, ex: benchmark.py)
+accidents_csv = os.environ.get("DASHBIKE_ACCIDENTS_CSV", "accidents-velos_clean.csv")
+accidents_cache = os.environ.get("DASHBIKE_ACCIDENTS_CACHE", "accidents-velos_clean.parquet")
+
+# on ordonne la variable mois pour avoir une année dans l'ordre
+mois_ordre = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
+jour_ordre = ["lundi","mardi","mercredi","jeudi","vendredi","samedi","dimanche"]
+# ordre d'affichage des modalités des variables qualitatives (utilisé aussi par Figure.category_orders)
+category_orders = {
+    "grav": ["Indemne", "Blessé léger", "Blessé hospitalisé", "Tué"],
+    "catr": ['Route Départementale', 'Voie Communales',
+             'Route nationale','Parc de stationnement ouvert à la circulation publique',
+             'Autoroute', 'Hors réseau public', 'Routes de métropole urbaine','autre'],
+    "obsm": ['Véhicule', 'Piéton','Véhicule sur rail',
+             'Animal domestique', 'Animal sauvage','Autre','Non renseigné'],
+    "atm": ['Normale', 'Temps éblouissant',
+            'Temps couvert','Brouillard - fumée','Pluie légère',
+            'Pluie forte','Vent fort - tempête','Neige - grêle','Autre'],
+    "situ": ["Sur chaussée", "Sur piste cyclable", "Sur bande cyclable", "Sur trottoir", "Autres"],
+    "trajet": ["Promenade - loisirs", "Domicile - travail", "Utilisation professionnelle",
+               "Courses - achats", "Domicile - école", "Autre"],
+    # Figure.color_discrete_map["sexe"] colore les modalités dans cet ordre
+    "sexe": ["Masculin", "Féminin"],
+}
+
+# schéma du jeu de données préparé: les variables qualitatives sont stockées en facteurs (codes entiers),
+# les années en int16 et les coordonnées en float32
+categorical_columns = ['grav', 'catr', 'obsm', 'atm', 'situ', 'trajet', 'sexe', 'age_group',
+                       'dep', 'dep_name', 'region_name', 'reg', 'lum', 'int', 'agg']
+numeric_dtypes = {'an': 'int16', 'lat': 'float32', 'long': 'float32'}
+# ordre physique des lignes du jeu préparé: les accidents d'une même année sont contigus (partitions annuelles,
+# voir Figure.partitions) et, dans chaque année, ceux d'une même région puis d'un même département (Figure.zone_rows)
+sort_columns = ['an', 'reg', 'dep']
+
+# contours des régions et départements: versions simplifiées servies par /assets, construites à partir des
+# contours des départements de pop_par_dep.csv (python Data.py geojson), et sources complètes en ligne si elles manquent
+geojson_sources = {
+    "regions": 'https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/regions.geojson',
+    "departements": 'https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/departements-avec-outre-mer.geojson',
+}
+geojson_dir = os.path.join("assets", "geojson")
+# tolérances de simplification (en degrés) et zoom minimal à partir duquel chacune est utilisée
+geojson_tolerances = {0.02: 0, 0.005: 6, 0.001: 8}
+# départements d'outre mer: chacun forme une région (codes région de l'INSEE), absente de pistes_dep.csv
+reg_outre_mer = {"971": "01", "972": "02", "973": "03", "974": "04", "976": "06"}
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Fonctions ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def ordered_categories(values: pd.Series, ordre: list = None):
+    """
+    Returns the categories of a qualitative column: the modalities of ordre present in the data, in that order,
+    followed by the other modalities of the data sorted alphabetically, so that no value is lost.
+
+    Parameters:
+    - values (pandas Series): The column.
+
+    - ordre (list or None): The display order of the modalities, if any.
+
+    Returns:
+    list: The categories.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        observed = set(values.cat.remove_unused_categories().cat.categories)
+    else:
+        observed = set(values.dropna().unique())
+    ordre = [m for m in (ordre or []) if m in observed]
+    return ordre + sorted(observed - set(ordre), key=str)
+
+
+def apply_schema(data: pd.DataFrame):
+    """
+    Converts the columns of the accident data to the types declared by categorical_columns and numeric_dtypes.
+    Can be applied again to already converted data, which only checks the categories.
+
+    Parameters:
+    - data (pandas DataFrame): The accident data.
+
+    Returns:
+    pandas DataFrame: The same data frame, converted in place.
+    """
+    for col in categorical_columns:
+        if col in data:
+            data[col] = data[col].astype(pd.CategoricalDtype(ordered_categories(data[col], category_orders.get(col))))
+    for col, dtype in numeric_dtypes.items():
+        if col in data:
+            data[col] = data[col].astype(dtype)
+    return data
+
+
+def sort_accidents(data: pd.DataFrame):
+    """
+    Sorts the accident data by the columns of sort_columns, in the order of their categories (codes sorted as text).
+
+    Parameters:
+    - data (pandas DataFrame): The accident data, schema applied.
+
+    Returns:
+    pandas DataFrame: The sorted data with a fresh 0..n-1 index, or the same data frame if it is already sorted.
+    """
+    keys = [data[col].cat.codes.to_numpy() if isinstance(data[col].dtype, pd.CategoricalDtype) else data[col].to_numpy()
+            for col in sort_columns if col in data]
+    if not keys:
+        return data
+    order = np.lexsort(keys[::-1])
+    # déjà trié (cache parquet écrit après le tri): aucune copie
+    if (order == np.arange(len(data))).all() and data.index.equals(pd.RangeIndex(len(data))):
+        return data
+    return data.take(order).reset_index(drop=True)
+
+
+def prepare_accidents(data: pd.DataFrame):
+    """
+    Applies the transformations needed by the dashboard to the raw accident data.
+
+    Parameters:
+    - data (pandas DataFrame): The accident data as read from the csv file.
+
+    Returns:
+    pandas DataFrame: The data with 'mois' and 'jour' as ordered categoricals, 'reg' as a zero padded code,
+    the types of the schema (see apply_schema) and the rows sorted by sort_columns.
+    """
+    # Conversion des variables 'mois' et 'jour' en facteurs ordonnés
+    data['mois'] = pd.Categorical(data['mois'], categories=mois_ordre, ordered=True)
+    data['jour'] = pd.Categorical(data['jour'], categories=jour_ordre, ordered=True)
+    # on recode proprement les codes reg
+    data["reg"] = data["reg"].astype(str).str.zfill(2)
+    return sort_accidents(apply_schema(data))
+
+
+def memory_report(csv_path: str = accidents_csv):
+    """
+    Compares the memory used by each column of the accident data as read from the csv file and once prepared.
+
+    Parameters:
+    - csv_path (string): Path of the csv file.
+
+    Returns:
+    pandas DataFrame: Type and size in MB of each column before and after, with a 'total' row.
+    """
+    raw = pd.read_csv(csv_path, low_memory=False)
+    before = raw.memory_usage(deep=True, index=False)
+    dtypes = raw.dtypes.astype(str)
+    data = prepare_accidents(raw)
+    after = data.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({"type_avant": dtypes, "Mo_avant": before / 2**20,
+                           "type_apres": data.dtypes.astype(str), "Mo_apres": after / 2**20})
+    report.loc["total"] = ["", report["Mo_avant"].sum(), "", report["Mo_apres"].sum()]
+    return report.round(2)
+
+
+def read_accidents_csv(csv_path: str = accidents_csv):
+    """
+    Reads and prepares the accident data from the csv file.
+
+    Parameters:
+    - csv_path (string): Path of the csv file.
+
+    Returns:
+    pandas DataFrame: The prepared accident data.
+    """
+    return prepare_accidents(pd.read_csv(csv_path, low_memory=False))
+
+
+def cache_is_fresh(csv_path: str = accidents_csv, cache_path: str = accidents_cache):
+    """
+    Tells if the columnar cache can be used in place of the csv file.
+
+    Parameters:
+    - csv_path (string): Path of the csv file.
+
+    - cache_path (string): Path of the parquet file.
+
+    Returns:
+    bool: True if the cache exists and is not older than the csv file.
+    """
+    if not os.path.exists(cache_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(cache_path) >= os.path.getmtime(csv_path)
+
+
+def build_cache(csv_path: str = accidents_csv, cache_path: str = accidents_cache):
+    """
+    Writes the prepared accident data to a parquet file, categoricals and padded codes included,
+    so that later loads skip the csv parsing. Requires pyarrow.
+
+    Parameters:
+    - csv_path (string): Path of the csv file.
+
+    - cache_path (string): Path of the parquet file to write.
+
+    Returns:
+    pandas DataFrame: The prepared accident data.
+    """
+    data = read_accidents_csv(csv_path)
+    # écriture dans un fichier temporaire pour ne jamais laisser un cache à moitié écrit
+    tmp_path = cache_path + ".tmp"
+    data.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return data
+
+
+def load_accidents(csv_path: str = accidents_csv, cache_path: str = accidents_cache):
+    """
+    Loads the prepared accident data, from the parquet cache when it is fresh, from the csv file otherwise.
+
+    Parameters:
+    - csv_path (string): Path of the csv file.
+
+    - cache_path (string): Path of the parquet file.
+
+    Returns:
+    pandas DataFrame: The prepared accident data.
+    """
+    if cache_is_fresh(csv_path, cache_path):
+        try:
+            # un cache écrit avant l'ajout d'une colonne au schéma ou avant le tri est converti au chargement
+            return sort_accidents(apply_schema(pd.read_parquet(cache_path, memory_map=True)))
+        except (ImportError, OSError, ValueError):
+            # pas de moteur parquet installé ou fichier illisible: on repart du csv
+            pass
+    return read_accidents_csv(csv_path)
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Contours geojson ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def simplify_line(coords, tolerance: float):
+    """
+    Simplifies a line or a ring with the Douglas-Peucker algorithm.
+
+    Parameters:
+    - coords (list): List of [lon, lat] positions.
+
+    - tolerance (float): Maximum distance, in degrees, between the original and the simplified line.
+
+    Returns:
+    numpy array: The kept positions, first and last ones always included.
+    """
+    points = np.asarray(coords, dtype=float)[:, :2]
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        seg = points[start + 1:end]
+        a, d = points[start], points[end] - points[start]
+        norm = np.hypot(d[0], d[1])
+        if norm == 0: # anneau fermé: distance au point de départ
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dist = np.abs(d[0] * (seg[:, 1] - a[1]) - d[1] * (seg[:, 0] - a[0])) / norm
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            k = start + 1 + i
+            keep[k] = True
+            stack += [(start, k), (k, end)]
+    return points[keep]
+
+
+def simplify_polygon(rings: list, tolerance: float):
+    # un anneau de moins de 4 positions n'est plus un polygone: le contour extérieur disparait, les trous sont ignorés
+    out = []
+    for i, ring in enumerate(rings):
+        simple = simplify_line(ring, tolerance)
+        if len(simple) < 4:
+            if i == 0:
+                return None
+            continue
+        out.append(np.round(simple, 5).tolist())
+    return out
+
+
+def simplify_geojson(geojson: dict, tolerance: float):
+    """
+    Simplifies every Polygon and MultiPolygon of a FeatureCollection.
+    Parts too small for the tolerance are dropped. If every part of a feature is dropped, its largest part is kept unsimplified.
+
+    Parameters:
+    - geojson (dict): The FeatureCollection.
+
+    - tolerance (float): Tolerance of the simplification, in degrees.
+
+    Returns:
+    dict: A new FeatureCollection with the simplified geometries and the same properties.
+    """
+    features = []
+    for feature in geojson["features"]:
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        else:
+            polygons = geometry["coordinates"]
+        simple = [p for p in (simplify_polygon(rings, tolerance) for rings in polygons) if p is not None]
+        if not simple:
+            largest = max(polygons, key=lambda rings: len(rings[0]))
+            simple = [[np.round(np.asarray(ring, dtype=float)[:, :2], 5).tolist() for ring in largest]]
+        features.append({"type": "Feature",
+                         "properties": feature["properties"],
+                         "geometry": {"type": "MultiPolygon", "coordinates": simple}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def geojson_file(name: str, tolerance: float):
+    return f"{name}-{tolerance}.geojson"
+
+
+def local_contours():
+    """
+    Builds the full resolution contours from the department geometries of pop_par_dep.csv, without network access.
+    Regions are the union of their departments (requires shapely).
+
+    Returns:
+    dict: {"regions": FeatureCollection, "departements": FeatureCollection}, features with 'code' and 'nom' properties
+    like the online sources.
+    """
+    from shapely.geometry import shape, mapping, Polygon, MultiPolygon
+    from shapely.ops import unary_union
+
+    def fill_gaps(geometry, min_area: float = 1e-4):
+        # les contours des départements ne se touchent pas exactement: l'union laisse de petits trous (< 1 km²) le long
+        # des frontières communes, qui sont comblés; les vrais trous (lacs, enclaves) sont gardés
+        polygons = geometry.geoms if isinstance(geometry, MultiPolygon) else [geometry]
+        return MultiPolygon([Polygon(p.exterior, [r for r in p.interiors if Polygon(r).area >= min_area]) for p in polygons])
+
+    pop = pd.read_csv("pop_par_dep.csv", sep=";", dtype=str)
+    pop["code"] = pop["Code Département"].str.zfill(2)
+    pistes = pd.read_csv("pistes_dep.csv", dtype=str)
+    dep_reg = {**dict(zip(pistes["dep"], pistes["reg"].str.split(".").str[0].str.zfill(2))), **reg_outre_mer}
+    departements = pd.read_csv("departements-region.csv", dtype=str)
+    reg_names = {dep_reg[dep]: name for dep, name in zip(departements["num_dep"], departements["region_name"]) if dep in dep_reg}
+
+    def feature(code, nom, geometry):
+        return {"type": "Feature", "properties": {"code": code, "nom": nom}, "geometry": geometry}
+
+    geometries = {code: json.loads(geom) for code, geom in zip(pop["code"], pop["geom"])}
+    deps = [feature(code, nom, geometries[code]) for code, nom in sorted(zip(pop["code"], pop["Département"]))]
+    regs = []
+    for reg in sorted(set(dep_reg[code] for code in geometries if code in dep_reg)):
+        union = fill_gaps(unary_union([shape(geometries[code]) for code in geometries if dep_reg.get(code) == reg]))
+        regs.append(feature(reg, reg_names.get(reg, reg), mapping(union)))
+    return {"regions": {"type": "FeatureCollection", "features": regs},
+            "departements": {"type": "FeatureCollection", "features": deps}}
+
+
+def download_contours():
+    """
+    Returns:
+    dict: The full resolution contours downloaded from geojson_sources, by name.
+    """
+    contours = {}
+    for name, url in geojson_sources.items():
+        with urllib.request.urlopen(url) as response:
+            contours[name] = json.load(response)
+    return contours
+
+
+def build_geojson(tolerances=geojson_tolerances, out_dir: str = geojson_dir, remote: bool = False):
+    """
+    Writes the simplified versions of the region and department contours in the assets folder.
+
+    Parameters:
+    - tolerances (iterable): The tolerances, in degrees, to generate.
+
+    - out_dir (string): The folder the files are written to.
+
+    - remote (bool): If True the contours are downloaded from geojson_sources,
+      otherwise they are built from pop_par_dep.csv (see local_contours).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    contours = download_contours() if remote else local_contours()
+    for name, geojson in contours.items():
+        for tolerance in tolerances:
+            with open(os.path.join(out_dir, geojson_file(name, tolerance)), "w", encoding="utf-8") as f:
+                json.dump(simplify_geojson(geojson, tolerance), f, separators=(",", ":"), ensure_ascii=False)
+
+
+def geojson_tolerance(zoom=None):
+    """
+    Returns the simplification tolerance to use for a given map zoom.
+
+    Parameters:
+    - zoom (numeric or None): The mapbox zoom, None for the initial view.
+
+    Returns:
+    float: The finest tolerance whose minimal zoom is reached (the most detailed contours allowed at that zoom).
+    """
+    zoom = 0 if zoom is None else zoom
+    return min(t for t, min_zoom in geojson_tolerances.items() if zoom >= min_zoom)
+
+
+def local_geojson(name: str, tolerance: float):
+    """
+    Tells if the simplified contours are available locally.
+
+    Returns:
+    bool: True if the file built by build_geojson exists.
+    """
+    return os.path.exists(os.path.join(geojson_dir, geojson_file(name, tolerance)))
+
+
+if __name__ == "__main__":
+    import sys
+    # python Data.py : (re)construit le cache colonne à partir du csv
+    # python Data.py memory : mémoire utilisée par chaque colonne avant et après application du schéma
+    # python Data.py geojson : construit les contours simplifiés de assets/geojson à partir de pop_par_dep.csv
+    # (python Data.py geojson remote : à partir des contours en ligne)
+    if "geojson" in sys.argv[1:]:
+        build_geojson(remote="remote" in sys.argv[1:])
+        print(f"contours simplifiés écrits dans {geojson_dir}")
+    elif "memory" in sys.argv[1:]:
+        print(memory_report().to_string())
+    else:
+        build_cache()
+        print(f"{accidents_cache} écrit à partir de {accidents_csv}")
@@ -1,90 +1,156 @@
 import dash 
+import os
 from dash import Dash,dcc,html,callback,Input,Output,State
 import dash_bootstrap_components as dbc
 import pandas as pd 
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from statsmodels.tsa.seasonal import seasonal_decompose
 from plotly.subplots import make_subplots
-from time import sleep
+from functools import lru_cache
+from collections import namedtuple
+import threading
+import Data
+import Cache
+import Metrics
 
 
 # --------------------------------------------------------------------------------------------------
 # ------------------------------------------ DATA ------------------------------------------------
 # --------------------------------------------------------------------------------------------------
 
+# geojson pour maps (versions complètes distantes, voir geojson_url pour les versions locales simplifiées)
+geojson_regions_url = Data.geojson_sources["regions"]
+geojson_departements_url = Data.geojson_sources["departements"]
+
+# 'mois' et 'jour' sont déjà des facteurs ordonnés (voir Data.prepare_accidents)
+mois_ordre = Data.mois_ordre
+jour_ordre = Data.jour_ordre
+
 #--------------------stockage des données-----------------------------------------
-data= pd.read_csv("accidents-velos_clean.csv",low_memory=False)
-# on recupere les données infos dep et reg
-pop=pd.read_csv("pop_par_dep.csv",sep=";")
-pistes_par_com=pd.read_csv("pistes_com.csv")
-pistes_par_dep=pd.read_csv("pistes_dep.csv")
-pistes_par_reg=pd.read_csv("pistes_reg.csv")
-# geojson pour maps
-geojson_regions_url = 'https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/regions.geojson'
-geojson_departements_url = 'https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/departements-avec-outre-mer.geojson'
-
-#--------------------------------Transformation de nos datas-----------------------
-# on ordonne la variable mois pour avoir une année dans l'ordre
-mois_ordre = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
-# Conversion de la variable 'mois' en facteur ordonnné
-data['mois'] = pd.Categorical(data['mois'], categories=mois_ordre, ordered=True)
-jour_ordre = ["lundi","mardi","mercredi","jeudi","vendredi","samedi","dimanche"]
-data['jour'] = pd.Categorical(data['jour'], categories=jour_ordre, ordered=True)
-
-# on crée un vecteur avec les années triés dans l'ordre
-mod = data["an"].unique()
-mod.sort()
-# on rajoute "all"
-mod_year = ["all"] + mod.tolist()
-
-
-#---------------- data accidents par region et departement -------------------#
-
-#on recode proprement les codes dep et reg
-pop['Code Département']=pop['Code Département'].astype(str).str.zfill(2)
-data["reg"]=data["reg"].astype(str).str.zfill(2)
-pistes_par_dep["reg"]=pistes_par_dep["reg"].astype(str).str.split('.').str[0].str.zfill(2)
-pistes_par_reg["reg"]=pistes_par_reg["reg"].astype(str).str.split('.').str[0].str.zfill(2)
-
-# on récupère le nombre d'accident par dep
-accidents_par_dep = data.groupby(['dep','dep_name','region_name','reg']).size().reset_index(name = "nombre_accidents")
-# ajout des derniers départements outre mers
-pop.loc[len(pop)] = ['978','Saint-Martin',72240,"",""]
-pop.loc[len(pop)] = ['987','Polynésie française',306280,"",""]
-pop.loc[len(pop)] = ['988','Nouvelle calédonie',210407,"",""]
-# tri par département
-pop = pop.sort_values('Code Département')
-# fusion des deux datas
-accidents_par_dep=pd.merge(accidents_par_dep, pop[['Code Département','Population','Département']], left_on='dep', right_on='Code Département', how='left')
-del accidents_par_dep['Code Département']
-# ajout de la variable ratio: nombre d'accidents pour 1000 habitants
-accidents_par_dep['ratio']=round(accidents_par_dep["nombre_accidents"]/accidents_par_dep["Population"].astype('int64')*1000,2)
-
-accidents_par_reg = accidents_par_dep.groupby(['region_name','reg']).agg({
-    'nombre_accidents': 'sum',
-    'Population': 'sum',
-    'ratio': 'mean'  
-}).reset_index()
-colonnes_entiers = ['nombre_accidents', 'Population']
-# Conversion des colonnes en entiers
-accidents_par_reg[colonnes_entiers] = accidents_par_reg[colonnes_entiers].astype(int)
-accidents_par_reg['ratio']=np.round(accidents_par_reg['ratio'],2)
-
-# on fusionne les informations pistes cyclables et accidents
-accidents_par_dep=pd.merge(accidents_par_dep,pistes_par_dep[['dep','nombre_pistes_cyclables','ratio']],on="dep",how='left')
-accidents_par_reg=pd.merge(accidents_par_reg,pistes_par_reg[['reg','nombre_pistes_cyclables','ratio']],on="reg",how='left')
-
-# on renomme les ratios pour éviter la confusion
-accidents_par_reg.rename(columns={"ratio_x": "ratio"}, inplace=True)
-accidents_par_reg.rename(columns={"ratio_y": "ratio_pistes"}, inplace=True)
-accidents_par_dep.rename(columns={"ratio_x": "ratio"}, inplace=True)
-accidents_par_dep.rename(columns={"ratio_y": "ratio_pistes"}, inplace=True)
-
-# on ajoute un ratio nombre accident sur nombre de pistes cyclables
-accidents_par_dep["ratio_accident_piste"]=round(accidents_par_dep["nombre_accidents"]/accidents_par_dep["nombre_pistes_cyclables"],2)
-accidents_par_reg["ratio_accident_piste"]=round(accidents_par_reg["nombre_accidents"]/accidents_par_reg["nombre_pistes_cyclables"],2)
+# Les données et les agrégats qui en dépendent ne sont pas calculés à l'import du module mais au premier accès
+# (fig.data, fig.cube, ...) ou au premier appel d'une fonction qui les utilise: importer Figure ne lit aucun fichier.
+lazy_tables = ['data', 'pop', 'pistes_par_com', 'pistes_par_dep', 'pistes_par_reg', 'mod', 'mod_year',
+               'accidents_par_dep', 'accidents_par_reg', 'filter_index', 'resume', 'cube',
+               'geo', 'zone_index', 'zone_options', 'partitions']
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def build_tables():
+    """
+    Loads the accident data and the region/department information, and builds every table derived from them.
+
+    Returns:
+    dict: The tables listed in lazy_tables, by name.
+    """
+    # lu depuis le cache parquet quand il est à jour (python Data.py), depuis le csv sinon
+    data= Data.load_accidents()
+    # on recupere les données infos dep et reg
+    pop=pd.read_csv("pop_par_dep.csv",sep=";")
+    pistes_par_com=pd.read_csv("pistes_com.csv")
+    pistes_par_dep=pd.read_csv("pistes_dep.csv")
+    pistes_par_reg=pd.read_csv("pistes_reg.csv")
+
+    #--------------------------------Transformation de nos datas-----------------------
+    # on crée un vecteur avec les années triés dans l'ordre
+    mod = data["an"].unique()
+    mod.sort()
+    # on rajoute "all"
+    mod_year = ["all"] + mod.tolist()
+
+
+    #---------------- data accidents par region et departement -------------------#
+
+    #on recode proprement les codes dep et reg
+    pop['Code Département']=pop['Code Département'].astype(str).str.zfill(2)
+    pistes_par_dep["reg"]=pistes_par_dep["reg"].astype(str).str.split('.').str[0].str.zfill(2)
+    pistes_par_reg["reg"]=pistes_par_reg["reg"].astype(str).str.split('.').str[0].str.zfill(2)
+
+    # on récupère le nombre d'accident par dep
+    accidents_par_dep = count_by(data, ['dep','dep_name','region_name','reg'], "nombre_accidents")
+    # ajout des derniers départements outre mers
+    pop.loc[len(pop)] = ['978','Saint-Martin',72240,"",""]
+    pop.loc[len(pop)] = ['987','Polynésie française',306280,"",""]
+    pop.loc[len(pop)] = ['988','Nouvelle calédonie',210407,"",""]
+    # tri par département
+    pop = pop.sort_values('Code Département')
+    # fusion des deux datas
+    accidents_par_dep=pd.merge(accidents_par_dep, pop[['Code Département','Population','Département']], left_on='dep', right_on='Code Département', how='left')
+    del accidents_par_dep['Code Département']
+    # ajout de la variable ratio: nombre d'accidents pour 1000 habitants
+    accidents_par_dep['ratio']=round(accidents_par_dep["nombre_accidents"]/accidents_par_dep["Population"].astype('int64')*1000,2)
+
+    accidents_par_reg = accidents_par_dep.groupby(['region_name','reg'], observed=True).agg({
+        'nombre_accidents': 'sum',
+        'Population': 'sum',
+        'ratio': 'mean'  
+    }).reset_index()
+    colonnes_entiers = ['nombre_accidents', 'Population']
+    # Conversion des colonnes en entiers
+    accidents_par_reg[colonnes_entiers] = accidents_par_reg[colonnes_entiers].astype(int)
+    accidents_par_reg['ratio']=np.round(accidents_par_reg['ratio'],2)
+
+    # on fusionne les informations pistes cyclables et accidents
+    accidents_par_dep=pd.merge(accidents_par_dep,pistes_par_dep[['dep','nombre_pistes_cyclables','ratio']],on="dep",how='left')
+    accidents_par_reg=pd.merge(accidents_par_reg,pistes_par_reg[['reg','nombre_pistes_cyclables','ratio']],on="reg",how='left')
+
+    # on renomme les ratios pour éviter la confusion
+    accidents_par_reg.rename(columns={"ratio_x": "ratio"}, inplace=True)
+    accidents_par_reg.rename(columns={"ratio_y": "ratio_pistes"}, inplace=True)
+    accidents_par_dep.rename(columns={"ratio_x": "ratio"}, inplace=True)
+    accidents_par_dep.rename(columns={"ratio_y": "ratio_pistes"}, inplace=True)
+
+    # on ajoute un ratio nombre accident sur nombre de pistes cyclables
+    accidents_par_dep["ratio_accident_piste"]=round(accidents_par_dep["nombre_accidents"]/accidents_par_dep["nombre_pistes_cyclables"],2)
+    accidents_par_reg["ratio_accident_piste"]=round(accidents_par_reg["nombre_accidents"]/accidents_par_reg["nombre_pistes_cyclables"],2)
+
+    # ordres des modalités qui dépendent des données (graphiques de la page 2)
+    category_orders.update({col: data[col].cat.categories.tolist() for col, ordre in category_orders.items() if ordre is None})
+
+    #---------------- hiérarchie géographique -------------------#
+    # noms des régions et départements, et lignes de chaque région et département dans data
+    geo = build_geo_hierarchy(data, pistes_par_reg)
+    zone_index = {zone: zone_ranges(data[zone]) for zone in zone_levels}
+    # options de 'zone-selection': seules les zones ayant des accidents, triées par code
+    zone_options = {zone: [{'label': f"{code} {geo[zone].get(str(code), '')}".strip(), 'value': code}
+                           for code in sorted(zone_index[zone], key=str)]
+                    for zone in zone_levels}
+
+    #---------------- agrégats de la france entière, calculés une seule fois -------------------#
+    # partitions annuelles: data est trié par année (Data.sort_columns), chaque année est une tranche de lignes
+    partitions = year_partitions(data)
+    # index des filtres de la carte, un par partition: l'année est choisie par la partition, pas par un bitmap
+    filter_index = {an: build_filter_index(data.iloc[rows], partition_filter_columns) for an, rows in partitions.items()}
+    # résumé des chiffres clés
+    resume = resume_chiffres(data)
+    # cube des comptages de la page 2
+    cube = build_cube(data)
+
+    return {name: value for name, value in locals().items() if name in lazy_tables}
+
+
+def load():
+    """
+    Builds the tables listed in lazy_tables as module attributes, once. Thread safe, does nothing once done.
+    Called on first access to one of them, and by warmup or the gunicorn master to pay the cost before serving.
+    """
+    global _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if not _loaded:
+            globals().update(build_tables())
+            _loaded = True
+
+
+def __getattr__(name):
+    # appelé seulement pour les attributs absents du module: les tables pas encore construites
+    if name in lazy_tables:
+        load()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # --------------------------------------------------------------------------------------------------
 # ------------------------------------------ Fonctions ------------------------------------------------
@@ -104,7 +170,170 @@ def unlist(input):
     return input
 
 
-def select_data(data: pd.DataFrame, selection: list):
+def group_codes(values: pd.Series, dropna: bool = True):
+    """
+    Maps a grouping column to integer codes following the order of a sorted groupby.
+
+    Parameters:
+    - values (pandas Series): The column.
+
+    - dropna (bool): If False, missing values get their own code, after the others.
+
+    Returns:
+    - numpy array: The code of each row, -1 for missing values when dropna is True.
+
+    - pandas Categorical or Index: The modalities corresponding to the codes, in order.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, modalities = values.cat.codes.to_numpy(), values.cat.categories
+        # l'ordre et le caractère ordonné des facteurs sont conservés dans le résultat
+        modalities = pd.Categorical(modalities, categories=modalities, ordered=values.cat.ordered)
+    else:
+        codes, modalities = pd.factorize(values, sort=True)
+    codes = codes.astype(np.int64)
+    if not dropna and (codes < 0).any():
+        # les valeurs manquantes forment un groupe placé après les autres, comme dans groupby
+        n = len(modalities)
+        codes[codes < 0] = n
+        if isinstance(modalities, pd.Categorical):
+            modalities = pd.Categorical.from_codes(np.r_[np.arange(n), -1], dtype=modalities.dtype)
+        else:
+            modalities = pd.Index(modalities).append(pd.Index([np.nan]))
+    return codes, modalities
+
+
+def count_by(data: pd.DataFrame, columns: list, name: str = "size", observed: bool = True, dropna: bool = True):
+    """
+    Counts the rows of each combination of the given columns in one vectorized pass: the codes of the columns
+    are combined into a single index counted with np.bincount.
+    Equivalent to data.groupby(columns, observed=observed, dropna=dropna).size().reset_index(name=name).
+
+    Parameters:
+    - data (pandas DataFrame): The data to count.
+
+    - columns (list or string): The grouping columns.
+
+    - name (string): The name of the count column.
+
+    - observed (bool): If True only the combinations present in the data are returned,
+      otherwise every combination of the modalities.
+
+    - dropna (bool): If True the rows with a missing value in a grouping column are not counted.
+
+    Returns:
+    pandas DataFrame: One row per combination, sorted like groupby (categories order, then ascending values).
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    codes, modalities = zip(*(group_codes(data[col], dropna) for col in columns))
+    dims = tuple(max(len(m), 1) for m in modalities)
+    keep = np.logical_and.reduce([c >= 0 for c in codes]) if dropna else slice(None)
+    index = np.ravel_multi_index(tuple(c[keep] for c in codes), dims) if len(data) else np.zeros(0, dtype=np.int64)
+
+    total = int(np.prod(dims, dtype=np.float64))
+    if not observed or total <= 4 * len(data) + 65536:
+        counts = np.bincount(index, minlength=total)
+        cells = np.arange(total) if not observed else np.flatnonzero(counts)
+        counts = counts[cells]
+    else:
+        # trop de combinaisons possibles pour un tableau dense: comptage des seules combinaisons présentes
+        cells, counts = np.unique(index, return_counts=True)
+
+    out = {}
+    for col, cell_codes, modality in zip(columns, np.unravel_index(cells, dims), modalities):
+        out[col] = modality.take(cell_codes) if len(modality) else np.empty(0)
+    out = pd.DataFrame(out)
+    out[name] = counts.astype(np.int64)
+    return out
+
+
+# colonnes filtrables depuis les dropdowns de la carte
+filter_columns = ['an', 'mois', 'jour', 'catr', 'obsm', 'atm']
+# colonnes indexées dans chaque partition annuelle
+partition_filter_columns = [col for col in filter_columns if col != 'an']
+
+
+def year_partitions(data: pd.DataFrame):
+    """
+    Finds the rows of each year in data sorted by year (the prepared data, and any zone taken from it with zone_data).
+
+    Parameters:
+    - data (pandas DataFrame): The accident data, sorted by 'an'.
+
+    Returns:
+    dict: {year: slice of the rows of that year}, years in ascending order.
+    """
+    an = data['an'].to_numpy()
+    if len(an) == 0:
+        return {}
+    starts = np.r_[0, np.flatnonzero(np.diff(an)) + 1]
+    stops = np.r_[starts[1:], len(an)]
+    return {int(an[start]): slice(int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+
+def selected_years(an):
+    """
+    Parameters:
+    - an ('all', [] or vector): The value of 'dropdown_an'.
+
+    Returns:
+    list: The years whose partition is to be read, all of them for 'all' or an empty selection.
+    """
+    load()
+    if not isinstance(an, list):
+        an = [an]
+    if an == [] or 'all' in an:
+        return list(partitions)
+    return [int(a) for a in an if int(a) in partitions]
+
+
+def build_filter_index(data: pd.DataFrame, columns: list = filter_columns):
+    """
+    Builds a bitmap index of the given data: for each column and each modality, the rows holding that modality packed into bits.
+        
+    Parameters:
+    - data (pandas dataframe): The data frame to be indexed.
+
+    - columns (list): The columns to be indexed.
+
+    Returns:
+    dict: {'n': number of rows, 'columns': {'column_name': {modality: packed bitmap}}}
+    """
+    index = {}
+    for col in columns:
+        codes, modalities = pd.factorize(data[col])
+        index[col] = {modality: np.packbits(codes == i) for i, modality in enumerate(modalities)}
+    return {'n': len(data), 'columns': index}
+
+
+def index_mask(index: dict, selection: dict):
+    """
+    Resolves a selection into a boolean row mask using a bitmap index: an OR of the bitmaps of the selected modalities
+    within each column, then an AND across columns.
+        
+    Parameters:
+    - index (dict): The index built by build_filter_index.
+
+    - selection (dictionary): Same format as for select_data.
+
+    Returns:
+    numpy array: Boolean array, True for the rows to keep.
+    """
+    mask = None
+    for col, modalities in selection.items():
+        bitmaps = index['columns'][col]
+        col_mask = np.zeros((index['n'] + 7) // 8, dtype=np.uint8)
+        for modality in modalities:
+            bitmap = bitmaps.get(modality)
+            if bitmap is not None:
+                col_mask |= bitmap
+        if mask is None:
+            mask = col_mask
+        else:
+            mask &= col_mask
+    return np.unpackbits(mask, count=index['n']).astype(bool)
+
+
+def select_data(data: pd.DataFrame, selection: list, index: dict = None):
     """
     Filters the given data so as to only keep rows containing the specified modalities
         
@@ -115,12 +344,16 @@ def select_data(data: pd.DataFrame, selection: list):
                               Dict format: {'column_name1' : ['modality1', 'modality2'],
                                             'column_name1' : ['modality1', 'modality2']}
 
+    - index (dict or None): Bitmap index of data built by build_filter_index. When given, all the columns are filtered in one pass.
+
     Returns:
     pandas dataframe: Dataframe containing only rows with the specified modalities
     """
     out = data
 
     if selection != {} and selection != 'all':
+        if index is not None:
+            return out[index_mask(index, selection)]
         for i in selection.items():
             out = out[out[i[0]].isin(i[1])]
             
@@ -133,7 +366,8 @@ def build_selection(data: pd.DataFrame,
                     jour = 'all',
                     catr = 'all',
                     obsm = 'all',
-                    atm = 'all'
+                    atm = 'all',
+                    index = None
                     ):
         
     """
@@ -155,6 +389,8 @@ def build_selection(data: pd.DataFrame,
 
     - atm ('all' or [] or vector): Vector containing all the modalities to be used to select atm
 
+    - index (dict or None): Bitmap index of data built by build_filter_index, see select_data.
+
     Returns:
     pandas dataframe: Dataframe containing only rows with the specified modalities
     """
@@ -179,7 +415,9 @@ def build_selection(data: pd.DataFrame,
     if atm != 'all' and atm != []:
         out['atm']=atm
 
-    return select_data(data, out)
+    return select_data(data, out, index)
+
+
 
 def data_filter(data: pd.DataFrame, x: str = None, y: str = None, x_select: None = None, y_select: None = None):
     """
@@ -218,50 +456,231 @@ def data_filter(data: pd.DataFrame, x: str = None, y: str = None, x_select: None
     return data
 
 
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------ Filtre géographique -----------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# niveaux géographiques du filtre 'zone-data-filter'
+zone_levels = ['reg', 'dep']
+# nombre de zones dont les lignes et le cube sont gardés en mémoire, par worker (DASHBIKE_ZONE_CACHE)
+zone_cache_size = int(os.environ.get("DASHBIKE_ZONE_CACHE", "128"))
+
+
+def build_geo_hierarchy(data: pd.DataFrame, regions: pd.DataFrame):
+    """
+    Builds the code -> name maps of the regions and departments from departements-region.csv,
+    the region codes of pistes_reg.csv and the codes and names found in the accident data.
+    The accident data is authoritative for the codes it contains, the csv files complete the others.
+
+    Parameters:
+    - data (pandas DataFrame): The accident data.
+
+    - regions (pandas DataFrame): The regions with their zero padded 'reg' code and 'region_name'.
+
+    Returns:
+    dict: 'reg' and 'dep': {code: name}, sorted by code. Codes are strings.
+    """
+    departements = pd.read_csv("departements-region.csv", dtype=str)
+    # couples (code, nom) présents dans les accidents
+    zones = data[['reg', 'region_name', 'dep', 'dep_name']].drop_duplicates().astype(str)
+
+    reg_names = {**dict(zip(regions['reg'], regions['region_name'])),
+                 **dict(zip(zones['reg'], zones['region_name']))}
+    dep_names = {**dict(zip(departements['num_dep'], departements['dep_name'])),
+                 **dict(zip(zones['dep'], zones['dep_name']))}
+    return {'reg': dict(sorted(reg_names.items())), 'dep': dict(sorted(dep_names.items()))}
+
+
+def zone_ranges(values: pd.Series):
+    """
+    Builds the row index of a column: for each code, the ranges of consecutive rows holding it.
+    The data being sorted by year then zone (see Data.sort_columns), each region or department has one range per year.
+
+    Parameters:
+    - values (pandas Series): The column, ex: data['dep'].
+
+    Returns:
+    dict: {code: numpy array of [start, stop) row ranges, shape (number of ranges, 2)}. Missing values are left out.
+    """
+    codes, modalities = group_codes(values)
+    if len(codes) == 0:
+        return {}
+    # début de chaque suite de lignes consécutives de même code
+    starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    stops = np.r_[starts[1:], len(codes)]
+    run_codes = codes[starts]
+    keep = run_codes >= 0
+    starts, stops, run_codes = starts[keep], stops[keep], run_codes[keep]
+    order = np.argsort(run_codes, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(run_codes[order])) + 1)
+    return {modalities[run_codes[g[0]]]: np.column_stack((starts[g], stops[g])) for g in groups if len(g)}
+
+
+def zone_rows(zone, code):
+    """
+    Parameters:
+    - zone (string): 'reg' or 'dep'.
+
+    - code (string): The code of the region or department.
+
+    Returns:
+    slice or numpy array: The rows of data of the zone, a slice when they are contiguous.
+    """
+    load()
+    ranges = zone_index[zone].get(code)
+    if ranges is None:
+        return slice(0, 0)
+    if len(ranges) == 1:
+        return slice(int(ranges[0, 0]), int(ranges[0, 1]))
+    return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+
+
+def zone_key(zone, code):
+    """
+    Builds the key stored in the session 'data-store' to describe the geographic filter.
+    Only this key travels between the browser and the server, the filtered data stays on the server.
+
+    Parameters:
+    - zone (string): The geographic level selected in 'zone-data-filter' ('all', 'reg' or 'dep').
+
+    - code (string or None): The code of the region or department selected in 'zone-selection'.
+
+    Returns:
+    dict or None: {'zone': zone, 'code': code}, or None when no filter is applied.
+    """
+    if zone == 'all' or code is None:
+        return None
+    return {'zone': zone, 'code': code}
+
+
+@lru_cache(maxsize=zone_cache_size)
+def _zone_data(zone, code):
+    # une tranche de lignes par année grâce au tri, pas de parcours de la colonne
+    load()
+    return data.iloc[zone_rows(zone, code)]
+
+
+@Metrics.timed("prep")
+def zone_data(store):
+    """
+    Resolves the key held by 'data-store' into the corresponding accident data.
+    Filtered frames are cached and shared between callbacks and users, they must not be modified in place.
+
+    Parameters:
+    - store (dict or None): The key built by zone_key.
+
+    Returns:
+    pandas DataFrame: The accidents of the selected zone, or the whole data if store is None.
+    """
+    load()
+    if store is None:
+        return data
+    return _zone_data(store['zone'], store['code'])
+
+
 # --------------------------------------------------------------------------------------------------
 # --------------------------------------- Les chiffres ---------------------------------------------
 # --------------------------------------------------------------------------------------------------
 
 
-def chiffres(data:pd.DataFrame=data,retour="nb_mort"):
+# résumé des chiffres clés d'une zone sur la dernière année collectée
+Resume = namedtuple("Resume", ["annee", "total", "morts", "hospitalisations", "mort_per", "hosp_per"])
+
+
+def resume_chiffres(data: pd.DataFrame = None):
+    """
+    Computes all the headline numbers of the home page in a single pass over the data.
+
+    Parameters:
+    - data (pandas DataFrame): The accident data of the zone, sorted by year (see Data.sort_columns), the whole data if None.
+
+    Returns:
+    Resume: Last year, number of accidents, deaths and hospitalizations that year, and the percentages displayed in the cards.
+    Without any accident the numbers are zeros and the year is None.
+    """
+    if data is None:
+        data = zone_data(None)
+    # data est trié par année: la dernière année est la dernière partition, trouvée par dichotomie
+    an = data['an'].to_numpy()
+    if len(an) == 0:
+        return Resume(None, 0, 0, 0, 0.0, 0.0)
+    annee = an[-1]
+    debut = int(np.searchsorted(an, annee, side="left"))
+    counts = data['grav'].iloc[debut:].value_counts()
+    total = len(an) - debut
+    morts = int(counts.get('Tué', 0))
+    hospitalisations = int(counts.get('Blessé hospitalisé', 0))
+    # pourcentage de morts rapporté aux accidents non mortels, comme auparavant
+    mort_per = round(morts / (total - morts) * 100, 0) if total > morts else 0.0
+    hosp_per = round(hospitalisations / total * 100, 0) if total > 0 else 0.0
+    return Resume(annee, total, morts, hospitalisations, mort_per, hosp_per)
+
+
+
+
+@lru_cache(maxsize=128)
+def _zone_resume(zone, code):
+    numbers = resume_chiffres(_zone_data(zone, code))
+    if numbers.annee is None:
+        # zone sans accident (ex: code département '2A' resté dans le store après le passage au niveau région):
+        # des zéros sur la dernière année nationale plutôt qu'une erreur dans le callback
+        load()
+        numbers = numbers._replace(annee=resume.annee)
+    return numbers
+
+
+@Metrics.timed("prep")
+def zone_resume(store):
+    """
+    Resolves the key held by 'data-store' into the headline numbers of the corresponding zone.
+
+    Parameters:
+    - store (dict or None): The key built by zone_key.
+
+    Returns:
+    Resume: The numbers of the selected zone, or the national ones if store is None.
+    """
+    load()
+    if store is None:
+        return resume
+    return _zone_resume(store['zone'], store['code'])
+
+
+def chiffres(resume: Resume = None,retour="nb_mort"):
+    if resume is None:
+        resume = zone_resume(None)
     style_div = {'width': '30%', 'display': 'inline-block'}
     style_nb_text1 = {'font-size': '100%', 'bottom' : '0%'}#{"margin": "0% 10% 0%"}#{'color' : 'white'}
     style_nb = {'font-size': '200%', 'margin' : '0%'}#{"text-align": "center", "margin" : "20px"}#{"display": "flex","justify-content": "center","align-items": "center"}
     style_nb_text2 = {'font-size': '100%'}
-# Calcule
-    mort_per = round(data[(data['an'] == data['an'].max()) & (data['grav'] == 'Tué')].count().iloc[0] / data[(data['an'] == data['an'].max()) & (data['grav'] != 'Tué')].count().iloc[0] * 100,0)
-    
-    hosp_per = round(data[(data['an'] == 2021) & (data['grav'] == 'Blessé hospitalisé')].count().iloc[0]/ data[(data['an'] == data['an'].max())].count().iloc[0] * 100,0)
-
-    #round(data[(data['an'] == data['an'].max()) & (data['grav'] == 'Blessé hospitalisé')].count().iloc[0] / data[(data['an'] == data['an'].max()) & (data['grav'] != 'Blessé hospitalisé')].count().iloc[0] * 100,0)  ce n'est pas le total!!
     
     if retour == 'nb_total':
         return html.Div(style=style_div,
                       children=[html.P(style=style_nb_text1,
-                                       children=[f"Nombre d'accidents recensés en {data['an'].max()}:"]), 
+                                       children=[f"Nombre d'accidents recensés en {resume.annee}:"]), 
                                 html.B(style=style_nb,
-                                       children=[f"{data[(data['an'] == data['an'].max())].count().iloc[0]}"])
+                                       children=[f"{resume.total}"])
                                        ])
     
     
     elif retour == 'nb_mort':
         return html.Div(style=style_div,
                       children=[html.P(style=style_nb_text1,
-                                       children=[f"Nombre de morts en {data['an'].max()}:"]), 
+                                       children=[f"Nombre de morts en {resume.annee}:"]), 
                                 html.B(style=style_nb,
-                                       children=[f"{data[(data['an'] == data['an'].max()) & (data['grav'] == 'Tué')].count().iloc[0]}"]),
+                                       children=[f"{resume.morts}"]),
                                 html.P(style=style_nb_text2,
-                                       children=[f"Représente {mort_per}% des accidents totaux."])
+                                       children=[f"Représente {resume.mort_per}% des accidents totaux."])
                                        ])
     
     else:
         return html.Div(style=style_div,
                       children=[html.P(style=style_nb_text1,
-                                       children=[f"Nombre d'hospitalisations en {data['an'].max()}:"]), 
+                                       children=[f"Nombre d'hospitalisations en {resume.annee}:"]), 
                                 html.B(style=style_nb,
-                                       children=[f"{data[(data['an'] == data['an'].max()) & (data['grav'] == 'Blessé hospitalisé')].count().iloc[0]}"]),
+                                       children=[f"{resume.hospitalisations}"]),
                                        html.P(style=style_nb_text2,
-                                       children=[f"Représente {hosp_per}% des accidents totaux."])
+                                       children=[f"Représente {resume.hosp_per}% des accidents totaux."])
                                        ])
 
 
@@ -277,8 +696,8 @@ def chiffres(data:pd.DataFrame=data,retour="nb_mort"):
 def fig1(data_in,niveau_geo):
     if niveau_geo== "nat":
         # on calcul les occurences des accidents par année
-        accidents_par_annee = data_in.groupby('an').size().reset_index(name='Nombre_d_accidents')
-        sleep(0.4) # Used to prevent a rendering bug between the px.line() and the grouby() data
+        # agrégation triée par année: l'ordre des points ne dépend plus de l'ordre des données d'entrée
+        accidents_par_annee = count_by(data_in, ['an'], 'Nombre_d_accidents')
         # Créer le lineplot pour la courbe évolutive
         fig1 = px.line(accidents_par_annee, x="an", y="Nombre_d_accidents",
                     markers=True,
@@ -291,7 +710,7 @@ def fig1(data_in,niveau_geo):
                                                 ]))
     
     elif niveau_geo== "reg":
-        accidents_par_annee_region = data_in.groupby(['an', 'region_name','reg']).size().reset_index(name='Nombre_d_accidents')
+        accidents_par_annee_region = count_by(data_in, ['an', 'region_name','reg'], 'Nombre_d_accidents')
         #accidents_par_annee_region = Figure.data_filter(accidents_par_annee_region, 'an', 'Nombre_d_accidents', None, None)
         # Créer le lineplot pour la courbe évolutive par région
         fig1 = px.line(accidents_par_annee_region, x="an", y="Nombre_d_accidents",
@@ -309,7 +728,7 @@ def fig1(data_in,niveau_geo):
 
 
     else:
-        accidents_par_annee_dep = data_in.groupby(['an','dep_name','dep']).size().reset_index(name='Nombre_d_accidents')
+        accidents_par_annee_dep = count_by(data_in, ['an','dep_name','dep'], 'Nombre_d_accidents')
         #accidents_par_annee_dep = Figure.data_filter(accidents_par_annee_dep, 'an', 'Nombre_d_accidents', None,None)
         # Créer le lineplot pour la courbe évolutive par région
         fig1 = px.line(accidents_par_annee_dep, x="an", y="Nombre_d_accidents",
@@ -350,8 +769,27 @@ def fig1(data_in,niveau_geo):
 # --------------------------------------------------------------------------------------------------
 
 
-def fig2(speed_animation, data: pd.DataFrame = data):
-    accidents_par_annee_mois = data.groupby(['an','mois'], observed=False).size().reset_index(name = 'Nombre_d_accidents')
+# durée d'une image de l'animation (ms) selon la vitesse choisie
+animation_durations = {"normal": 1500, "x1.5": 1000, "x2": 750, "x4": 1500/4, "x8": 1500/8}
+
+
+def animation_duration(speed_animation):
+    """
+    Returns the duration of a frame of the fig2 animation, in milliseconds.
+
+    Parameters:
+    - speed_animation (string): The value of 'speed-dropdown'. Unknown values give the normal speed.
+
+    Returns:
+    numeric: The frame duration.
+    """
+    return animation_durations.get(speed_animation, animation_durations["normal"])
+
+
+def fig2(speed_animation, data: pd.DataFrame = None):
+    if data is None:
+        data = zone_data(None)
+    accidents_par_annee_mois = count_by(data, ['an','mois'], 'Nombre_d_accidents', observed=False)
     fig2 = px.line(accidents_par_annee_mois, x="mois", y="Nombre_d_accidents", 
                   markers=True,animation_frame="an"
                  ,custom_data=['an','mois','Nombre_d_accidents'])
@@ -363,16 +801,7 @@ def fig2(speed_animation, data: pd.DataFrame = data):
                       yaxis_title="Nombre d'accidents"
                      )
     # la vitese d'animation
-    if speed_animation=="x8":
-        fig2.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1500/8
-    elif speed_animation=="x4":
-        fig2.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1500/4
-    elif speed_animation=="x2":
-        fig2.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 750
-    elif speed_animation=="x1.5":
-        fig2.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1000
-    else:
-        fig2.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1500
+    fig2.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = animation_duration(speed_animation)
     
     # changer l'echelle des ordonnées
     #fig2.update_yaxes(range=[0, 1100])
@@ -399,7 +828,7 @@ def fig2(speed_animation, data: pd.DataFrame = data):
 
 def fig_seri_reg(data_in, x_select = None, y_select = None):
     # On calcule les occurrences des accidents par année et par région
-    accidents_par_annee_region = data_in.groupby(['an', 'region_name']).size().reset_index(name='Nombre_d_accidents')
+    accidents_par_annee_region = count_by(data_in, ['an', 'region_name'], 'Nombre_d_accidents')
 
     # On filtre les données en fonction des axes d'un graphique filtre
     accidents_par_annee_region = data_filter(accidents_par_annee_region, 'an', 'Nombre_d_accidents', x_select, y_select)
@@ -444,41 +873,102 @@ def fig_seri_reg(data_in, x_select = None, y_select = None):
 # --------------------------------------------------------------------------------------------------
 
 
-def fig3(data:pd.DataFrame=data):
+def decomposition(data: pd.DataFrame):
+    """
+    Computes the monthly number of accidents and its additive seasonal decomposition (period of 12 months).
+
+    Parameters:
+    - data (pandas DataFrame): The accident data of the zone.
+
+    Returns:
+    pandas DataFrame: One row per month with 'an', 'mois', 'date', 'Nombre_d_accidents' and the 'observed', 'seasonal', 'trend' and 'resid' components.
+    With less than two years of history the series can not be decomposed: 'seasonal', 'trend' and 'resid' are NaN.
+    """
     # on récupère les accidents par année et par mois
-    accidents_par_annee_mois= data.groupby(['an','mois'], observed=False).size().reset_index(name='Nombre_d_accidents')
+    composantes = count_by(data, ['an','mois'], 'Nombre_d_accidents', observed=False)
     # Création d'une variable date en fusionnant les années et les mois
-    accidents_par_annee_mois['date'] = accidents_par_annee_mois['an'].astype(str) + '-' + accidents_par_annee_mois['mois'].astype(str)
-    # Décomposition de la série
-    result = seasonal_decompose(accidents_par_annee_mois['Nombre_d_accidents'], model='additive', period=12)  # période saisonnière de 12 mois
+    composantes['date'] = composantes['an'].astype(str) + '-' + composantes['mois'].astype(str)
+    composantes['observed'] = composantes['Nombre_d_accidents'].astype(float)
+    # moins de deux cycles de 12 mois: seasonal_decompose échouerait, seule la série observée est affichée
+    if len(composantes) < 24:
+        composantes[['seasonal', 'trend', 'resid']] = np.nan
+        return composantes
+    # Décomposition de la série (statsmodels n'est importé qu'au premier calcul)
+    from statsmodels.tsa.seasonal import seasonal_decompose
+    result = seasonal_decompose(composantes['Nombre_d_accidents'], model='additive', period=12)  # période saisonnière de 12 mois
+    composantes['observed'] = result.observed
+    composantes['seasonal'] = result.seasonal
+    composantes['trend'] = result.trend
+    composantes['resid'] = result.resid
+    return composantes
+
+
+# décompositions déjà calculées, par filtre géographique (None pour la france entière)
+decompositions = Cache.LRUCache(maxsize=256)
+
+
+@Metrics.timed("prep")
+def zone_decomposition(store):
+    """
+    Resolves the key held by 'data-store' into the seasonal decomposition of the corresponding zone, computed once per zone.
+
+    Parameters:
+    - store (dict or None): The key built by zone_key.
+
+    Returns:
+    pandas DataFrame: The decomposition returned by decomposition.
+    """
+    if store is None:
+        return decompositions.get_or_build(None, lambda: decomposition(zone_data(None)))
+    return decompositions.get_or_build((store['zone'], store['code']),
+                                       lambda: decomposition(_zone_data(store['zone'], store['code'])))
+
+
+def precompute_decompositions(background: bool = False):
+    """
+    Computes the decomposition of France, of every region and of every department so that fig3 is only a cache lookup.
+
+    Parameters:
+    - background (bool): If True the computation runs in a daemon thread and the function returns immediately.
+    """
+    if background:
+        threading.Thread(target=precompute_decompositions, name="precompute-decompositions", daemon=True).start()
+        return
+
+    load()
+    zone_decomposition(None)
+    for zone in ['reg', 'dep']:
+        # un seul parcours des données par niveau plutôt qu'un filtre par zone
+        for code, data_zone in data.groupby(zone, observed=True):
+            if (zone, code) not in decompositions:
+                decompositions.set((zone, code), decomposition(data_zone))
+
+
+def fig3(composantes: pd.DataFrame = None):
+    if composantes is None:
+        composantes = zone_decomposition(None)
+    # mêmes informations de popup pour les quatre composantes
+    customdata = composantes[['an', 'mois', 'Nombre_d_accidents']]
     fig3 = go.Figure()
     # Ajout de la composante observée
-    fig3.add_trace(go.Scatter(x=accidents_par_annee_mois['date'], y=result.observed,
+    fig3.add_trace(go.Scatter(x=composantes['date'], y=composantes['observed'],
                              mode='lines', name='Composante observée',
-                             customdata=pd.DataFrame({'an': accidents_par_annee_mois['an'],
-                                                     'mois': accidents_par_annee_mois['mois'],
-                                                     'Nombre_d_accidents': accidents_par_annee_mois['Nombre_d_accidents']})))
+                             customdata=customdata))
     
     # Ajout de la composante saisonnière
-    fig3.add_trace(go.Scatter(x=accidents_par_annee_mois['date'], y=result.seasonal, visible='legendonly',
+    fig3.add_trace(go.Scatter(x=composantes['date'], y=composantes['seasonal'], visible='legendonly',
                              mode='lines', name='Saisonnalité',
-                             customdata=pd.DataFrame({'an': accidents_par_annee_mois['an'],
-                                                     'mois': accidents_par_annee_mois['mois'],
-                                                     'Nombre_d_accidents': accidents_par_annee_mois['Nombre_d_accidents']})))
+                             customdata=customdata))
     
     # Ajout de la composante de tendance
-    fig3.add_trace(go.Scatter(x=accidents_par_annee_mois['date'], y=result.trend,
+    fig3.add_trace(go.Scatter(x=composantes['date'], y=composantes['trend'],
                              mode='lines', name='Tendance',
-                             customdata=pd.DataFrame({'an': accidents_par_annee_mois['an'],
-                                                     'mois': accidents_par_annee_mois['mois'],
-                                                     'Nombre_d_accidents': accidents_par_annee_mois['Nombre_d_accidents']})))
+                             customdata=customdata))
     
     # Ajout de la composante résiduelle
-    fig3.add_trace(go.Scatter(x=accidents_par_annee_mois['date'], y=result.resid, visible='legendonly',
+    fig3.add_trace(go.Scatter(x=composantes['date'], y=composantes['resid'], visible='legendonly',
                              mode='lines', name='Résidus',
-                             customdata=pd.DataFrame({'an': accidents_par_annee_mois['an'],
-                                                     'mois': accidents_par_annee_mois['mois'],
-                                                     'Nombre_d_accidents': accidents_par_annee_mois['Nombre_d_accidents']})))
+                             customdata=customdata))
     
     # Titre
     fig3.update_layout(margin={"r": 0, "t": 30, "l": 0, "b": 0},
@@ -578,6 +1068,7 @@ def update_popup(zone):
 
 
 def bar_popup(zone_geo,indicateur):
+    load()
     if indicateur == "qte":
         if zone_geo == "reg":
             fig = px.bar(pistes_par_reg, y="region_name", x="nombre_pistes_cyclables", color="region_name",
@@ -622,29 +1113,19 @@ def bar_popup(zone_geo,indicateur):
 # ----------------------------------------- Pie chart -----------------------------------------------
 # --------------------------------------------------------------------------------------------------
 
-def pie_age_grav(modalite,annee, data: pd.DataFrame = data):
-    if annee==2004:# cas du "all"
-        age_mort = data[data["grav"]==modalite].groupby(["age_group"]).size().reset_index(name= "nb_accidents")
-    else:
-        age_mort = data[(data["grav"]==modalite) & (data["an"]==annee)].groupby(["age_group"]).size().reset_index(name= "nb_accidents")
-    
-    labels = age_mort["age_group"]
-    values = age_mort["nb_accidents"]
+def pie_age_grav(modalite,annee, cube: dict = None):
+    if cube is None:
+        cube = zone_cube(None)
+    # nombre d'accidents par tranche d'âge pour une gravité donnée, annee == 2004 correspond au cas du "all"
+    def age_grav(grav):
+        cells = cube_slice(cube, "all", annee, grav=grav)
+        return cells.groupby("age_group", observed=True)["nb_accidents"].sum().reset_index(name="nombre_d'accidents")
+
     if modalite == "all":
-        data_grav1 = data[data['grav'] == 'Indemne']
-        data_grav2 = data[data['grav'] == 'Blessé léger']
-        data_grav3 = data[data['grav'] == 'Blessé hospitalisé']
-        data_grav4 = data[data['grav'] == 'Tué']
-        if annee==2004:# cas du "all"
-            loc1 = data_grav1.groupby('age_group').size().reset_index(name="nombre_d'accidents")
-            loc2 = data_grav2.groupby('age_group').size().reset_index(name="nombre_d'accidents")
-            loc3 = data_grav3.groupby('age_group').size().reset_index(name="nombre_d'accidents")
-            loc4 = data_grav4.groupby('age_group').size().reset_index(name="nombre_d'accidents")
-        else:
-            loc1 = data_grav1[data_grav1["an"]==annee].groupby('age_group').size().reset_index(name="nombre_d'accidents")
-            loc2 = data_grav2[data_grav2["an"]==annee].groupby('age_group').size().reset_index(name="nombre_d'accidents")
-            loc3 = data_grav3[data_grav3["an"]==annee].groupby('age_group').size().reset_index(name="nombre_d'accidents")
-            loc4 = data_grav4[data_grav4["an"]==annee].groupby('age_group').size().reset_index(name="nombre_d'accidents")
+        loc1 = age_grav('Indemne')
+        loc2 = age_grav('Blessé léger')
+        loc3 = age_grav('Blessé hospitalisé')
+        loc4 = age_grav('Tué')
 
         values1 = loc1["nombre_d'accidents"].tolist()
         values2 = loc2["nombre_d'accidents"].tolist()
@@ -682,6 +1163,9 @@ def pie_age_grav(modalite,annee, data: pd.DataFrame = data):
                          hovermode="closest" # Recomended if using select in clickmode 
         )
     else:
+        age_mort = age_grav(modalite)
+        labels = age_mort["age_group"]
+        values = age_mort["nombre_d'accidents"]
         if modalite == "Indemne":
             color=['#c2f0c2', '#7ccf7c', '#4cae4c', '#238b23']
         elif modalite == "Blessé léger":
@@ -724,27 +1208,116 @@ color_discrete_map = {
         "sexe": ['#6495ed','#ff6666']
 }
 category_orders = {
-        "grav": ["Indemne", "Blessé léger", "Blessé hospitalisé", "Tué"],
-        "situ": data["situ"].unique(),
-        "trajet": data["trajet"].unique(),
-        "sexe": data["sexe"].unique(),
-        "dep" : data["dep"].unique(),
-        "region_name" : data["region_name"].unique(),
-        "catr": ['Route Départementale', 'Voie Communales',
-           'Route nationale','Parc de stationnement ouvert à la circulation publique',
-           'Autoroute', 'Hors réseau public', 'Routes de métropole urbaine','autre'],
-        "obsm": ['Véhicule', 'Piéton','Véhicule sur rail',
-       'Animal domestique', 'Animal sauvage','Autre','Non renseigné'],
-        "atm":['Normale', 'Temps éblouissant',
-       'Temps couvert','Brouillard - fumée','Pluie légère',
-       'Pluie forte','Vent fort - tempête','Neige - grêle','Autre']
+        "grav": Data.category_orders["grav"],
+        # ordre des facteurs des données, complété au chargement (voir build_tables): l'ordre déclaré dans
+        # Data.category_orders puis les autres modalités par ordre alphabétique
+        "situ": None,
+        "trajet": None,
+        "sexe": None,
+        "dep" : None,
+        "region_name" : None,
+        "catr": Data.category_orders["catr"],
+        "obsm": Data.category_orders["obsm"],
+        "atm": Data.category_orders["atm"]
 }
 
 
-def density(variable, annee, data: pd.DataFrame = data, title_comp=None):
+# --------------------------------------------------------------------------------------------------
+# ----------------------------------------- Cube de comptages -----------------------------------------------
+# --------------------------------------------------------------------------------------------------
+# dimensions communes à toutes les cellules du cube
+cube_dims = ['an', 'mois', 'age_group', 'grav']
+# variables proposées sur la page 2, chacune a sa propre table dans le cube
+cube_variables = list(dict.fromkeys([*variable_names, *category_orders]))
+
+
+def build_cube(data: pd.DataFrame):
+    """
+    Precomputes the number of accidents for every combination of an, mois, age_group and grav,
+    crossed with each variable of the page 2 dropdown.
+    Rows with missing values are kept so that totals stay equal to the number of accidents.
+
+    Parameters:
+    - data (pandas DataFrame): The accident data the cube is to be built from.
+
+    Returns:
+    dict: {'all': DataFrame, variable: DataFrame, ...} each DataFrame containing the dimension columns and "nb_accidents".
+    """
+    cube = {"all": count_by(data, cube_dims, "nb_accidents", dropna=False)}
+    for variable in cube_variables:
+        if variable in cube_dims:
+            cube[variable] = cube["all"]
+        else:
+            cube[variable] = count_by(data, cube_dims + [variable], "nb_accidents", dropna=False)
+    return cube
+
+
+def cube_slice(cube: dict, variable="all", annee=2004, age_group=None, grav=None):
+    """
+    Returns the cells of the cube matching the given filters. Cost depends on the number of cells, not on the number of accidents.
+
+    Parameters:
+    - cube (dict): Cube built by build_cube.
+
+    - variable (string): The variable of the page 2 dropdown, "all" if none.
+
+    - annee (numeric): The year to keep, 2004 meaning all years (value of "all" on the slider).
+
+    - age_group (string or None): The age group to keep, None to keep all of them.
+
+    - grav (string or None): The injury severity to keep, None or "all" to keep all of them.
+
+    Returns:
+    pandas DataFrame: The selected cells with their "nb_accidents" count.
+    """
+    cells = cube.get(variable, cube["all"])
+    if annee != 2004:
+        # les cellules sont triées par année (première dimension du cube): on ne garde que la tranche de l'année
+        an = cells["an"].to_numpy()
+        cells = cells.iloc[np.searchsorted(an, annee, side="left"):np.searchsorted(an, annee, side="right")]
+    mask = np.ones(len(cells), dtype=bool)
+    if age_group is not None:
+        mask &= (cells["age_group"] == age_group).to_numpy()
+    if grav is not None and grav != "all":
+        mask &= (cells["grav"] == grav).to_numpy()
+    cells = cells[mask]
+    # seules les modalités présentes dans la sélection apparaissent dans les regroupements avec observed=False
+    if variable in Data.categorical_columns:
+        cells = cells.assign(**{variable: cells[variable].cat.remove_unused_categories()})
+    return cells
+
+
+
+
+@lru_cache(maxsize=zone_cache_size)
+def _zone_cube(zone, code):
+    return build_cube(_zone_data(zone, code))
+
+
+@Metrics.timed("prep")
+def zone_cube(store):
+    """
+    Resolves the key held by 'data-store' into the count cube of the corresponding zone.
+
+    Parameters:
+    - store (dict or None): The key built by zone_key.
+
+    Returns:
+    dict: The cube of the selected zone, or the national cube if store is None.
+    """
+    load()
+    if store is None:
+        return cube
+    return _zone_cube(store['zone'], store['code'])
+
+
+def density(variable, annee, cube: dict = None, title_comp=None, age_group=None, grav=None, cells=None):
+    # cells: sélection du cube déjà faite (partagée avec bar par le callback de la page 2)
+    if cells is None:
+        cells = cube_slice(cube if cube is not None else zone_cube(None), variable, annee, age_group, grav)
     if variable == "all":
         if annee == 2004: # equivalent a all pour le slider
-            df = data.groupby("an").size().reset_index(name="nb_accidents")
+            df = cells.groupby("an")["nb_accidents"].sum().reset_index()
             fig = px.area(df,x = "an",y = "nb_accidents", custom_data = ['an','nb_accidents'])
             fig.update_traces(hovertemplate="<br>".join([
                                                  "Année : %{customdata[0]}",
@@ -752,7 +1325,7 @@ def density(variable, annee, data: pd.DataFrame = data, title_comp=None):
                                                  ]))
             fig.update_layout(xaxis_title = "Année")
         else:
-            df = data[data["an"]==annee].groupby("mois",observed=False).size().reset_index(name="nb_accidents")
+            df = cells.groupby("mois",observed=False)["nb_accidents"].sum().reset_index()
             fig = px.area(df,x = "mois",y = "nb_accidents",custom_data = ['mois','nb_accidents'])
             fig.update_traces(hovertemplate="<br>".join([
                                                  "Mois : %{customdata[0]}",
@@ -760,7 +1333,7 @@ def density(variable, annee, data: pd.DataFrame = data, title_comp=None):
                                                  ]))
     else:
         if annee == 2004: # equivalent a all pour le slider
-            df = data.groupby(["an",variable],observed=False).size().reset_index(name="nb_accidents")
+            df = cells.groupby(["an",variable],observed=False)["nb_accidents"].sum().reset_index()
             fig = px.area(df,x = "an",y = "nb_accidents",color=variable,custom_data = ['an','nb_accidents',variable],
                          color_discrete_sequence=color_discrete_map.get(variable, px.colors.qualitative.Set1),
                           category_orders={variable: category_orders.get(variable)})
@@ -770,7 +1343,7 @@ def density(variable, annee, data: pd.DataFrame = data, title_comp=None):
                                                  ]))
             fig.update_layout(xaxis_title = "Année")
         else:
-            df = data[data["an"]==annee].groupby(["mois",variable],observed=False).size().reset_index(name="nb_accidents")
+            df = cells.groupby(["mois",variable],observed=False)["nb_accidents"].sum().reset_index()
             fig = px.area(df,x = "mois",y = "nb_accidents",color=variable,custom_data = ['mois','nb_accidents',variable],
                          color_discrete_sequence=color_discrete_map.get(variable, px.colors.qualitative.Set1),
                           category_orders={variable: category_orders.get(variable)})
@@ -803,19 +1376,15 @@ def density(variable, annee, data: pd.DataFrame = data, title_comp=None):
 # --------------------------------------------------------------------------------------------------
 
 
-def bar(var, annee, data: pd.DataFrame = data, title_comp = None):
+def bar(var, annee, cube: dict = None, title_comp = None, age_group=None, grav=None, cells=None):
+    if cells is None:
+        cells = cube_slice(cube if cube is not None else zone_cube(None), var, annee, age_group, grav)
     if var =="all":
-        if annee == 2004: # equivalent a all pour le slider
-            accidents = data.shape[0]
-        else: 
-            accidents = data[data["an"]==annee].shape[0]
+        accidents = cells["nb_accidents"].sum()
         total_accidents = pd.DataFrame({'Total d\'accidents': [accidents]})
         fig = px.bar(total_accidents, y='Total d\'accidents') 
     else:
-        if annee == 2004: # equivalent a all pour le slider
-            accidents_par_var = data.groupby(var).size().reset_index(name="nb_accidents")
-        else:
-            accidents_par_var = data[data["an"] == annee].groupby(var).size().reset_index(name="nb_accidents")
+        accidents_par_var = cells.groupby(var, observed=True)["nb_accidents"].sum().reset_index()
         accidents_par_var = accidents_par_var.sort_values('nb_accidents', ascending=False)
         fig = px.bar(accidents_par_var, x=var, y="nb_accidents")
     fig.update_layout(xaxis_title = annee if annee != 2004 else "De 2005 à 2021",yaxis_title = "Nombre d'accidents",legend_title_text=variable_names.get(var, var),
@@ -839,35 +1408,168 @@ def bar(var, annee, data: pd.DataFrame = data, title_comp = None):
 # --------------------------------------------------------------------------------------------------
 # ----------------------------------------- map -----------------------------------------------
 # --------------------------------------------------------------------------------------------------
-def carte(color, an, mois, jour, catr, cbsm, atm):
-        legend_title_selection = {"grav" : "Gravité de l'accident",
-                                "int" : "Type d'intersection ou<br>s'est produit l'accident",
-                                "lum" : "Conditions d'éclairage<br>du lieu de l'accident",
-                                "jour" : "Jour de la semaine"}
-
-        map = px.scatter_mapbox(build_selection(data, an, mois, jour, catr, cbsm, atm),#select_data(data,selection=select), 
-                            lat="lat", 
-                            lon="long", 
-                            mapbox_style="carto-positron", 
-                            center={"lat":46.6031, 'lon':1.8883},
-                            zoom=4.8,
-                            custom_data=["date","hrmn","trajet", "int", "lum", 'com_name'],
-                            color=unlist(color),
-                            #color_discrete_sequence=color_select(unlist(color)),
-                            color_discrete_map = {'Blessé léger':'#6495ed', 'Blessé hospitalisé':'#ffa54f', 'Tué':'#ff6666', 'Indemne':'#4cae4c'},
-                            height=700,
-                            width=1000
-                            )
-        
-        map.update_traces(hovertemplate="<br>".join(["Date : %{customdata[0]}", 
-                                                "Heure : %{customdata[1]}", 
-                                                "Type de trajet : %{customdata[2]}", 
-                                                "Intersection: %{customdata[3]}", 
-                                                "Conditions d'éclairage: %{customdata[4]}",
-                                                "Nom commune: %{customdata[5]}"]))
+# en dessous de ce nombre d'accidents dans la zone visible les points sont affichés un par un, au dessus ils sont
+# regroupés par cellule: les cellules sont limitées à la fenêtre de view_window, leur nombre ne dépend pas des données
+carte_max_points = 5000
+# nombre de cellules de la grille sur la largeur d'une tuile de carte
+carte_cells_per_tile = 16
+# zoom initial de la carte
+carte_zoom = 4.8
+
+carte_legend_title = {"grav" : "Gravité de l'accident",
+                      "agg" : "Agglomération",
+                      "int" : "Type d'intersection ou<br>s'est produit l'accident",
+                      "lum" : "Conditions d'éclairage<br>du lieu de l'accident",
+                      "jour" : "Jour de la semaine"}
+
+
+def grid_level(zoom=carte_zoom):
+    """
+    Returns the level of the aggregation grid used for a given map zoom.
+
+    Parameters:
+    - zoom (numeric or None): The mapbox zoom, None for the initial zoom.
+
+    Returns:
+    int: The integer part of the zoom, between 0 and 20.
+    """
+    if zoom is None:
+        zoom = carte_zoom
+    return int(min(max(np.floor(zoom), 0), 20))
+
+
+def view_window(bounds, niveau: int):
+    """
+    Snaps the visible area of the map to the map tiles of a grid level, with one tile of margin on each side,
+    so that small moves of the map keep the same window, the same points and the same cached figure.
+
+    Parameters:
+    - bounds (list or None): [lon_min, lon_max, lat_min, lat_max] of the visible area, None if unknown.
+
+    - niveau (int): The grid level given by grid_level.
+
+    Returns:
+    list or None: [lon_min, lon_max, lat_min, lat_max] of the window, None when bounds is None (no clipping).
+    """
+    if bounds is None:
+        return None
+    tile = 360 / 2**niveau
+    lon_min, lon_max, lat_min, lat_max = bounds
+    return [float((np.floor(lon_min / tile) - 1) * tile), float((np.ceil(lon_max / tile) + 1) * tile),
+            float(max((np.floor(lat_min / tile) - 1) * tile, -90)), float(min((np.ceil(lat_max / tile) + 1) * tile, 90))]
+
+
+def carte_points(an, mois, jour, catr, cbsm, atm, window=None):
+    """
+    Selects the accidents shown on the map: the dropdown filters, then the visible window.
+
+    Parameters:
+    - an, mois, jour, catr, cbsm, atm: The values of the map dropdowns, see build_selection.
+
+    - window (list or None): The window built by view_window, None to keep the whole country.
+
+    Returns:
+    pandas DataFrame: The selected accidents.
+    """
+    load()
+    # seules les partitions des années sélectionnées sont lues, chacune filtrée avec son propre index
+    parts = [build_selection(data.iloc[partitions[year]], 'all', mois, jour, catr, cbsm, atm, filter_index[year])
+             for year in selected_years(an)]
+    points = pd.concat(parts) if len(parts) > 1 else parts[0] if parts else data.iloc[:0]
+    if window is not None:
+        lon, lat = points["long"].to_numpy(), points["lat"].to_numpy()
+        points = points[(lon >= window[0]) & (lon <= window[1]) & (lat >= window[2]) & (lat <= window[3])]
+    return points
+
+
+def bin_points(points: pd.DataFrame, color: str, niveau: int):
+    """
+    Groups the accidents into the square cells of a grid whose size depends on the zoom level.
+
+    Parameters:
+    - points (pandas DataFrame): The accidents to group, with 'lat' and 'long' columns.
+
+    - color (string): The column whose most frequent modality is kept for each cell.
+
+    - niveau (int): The grid level given by grid_level. Cells are halved at each level.
+
+    Returns:
+    pandas DataFrame: One row per non empty cell with its centroid ('lat', 'long'), "nb_accidents" and the dominant modality of color.
+    """
+    size = 360 / 2**niveau / carte_cells_per_tile
+    points = points.dropna(subset=["lat", "long"])
+    cells = pd.DataFrame({"ix": np.floor(points["long"].to_numpy() / size).astype(np.int64),
+                          "iy": np.floor(points["lat"].to_numpy() / size).astype(np.int64),
+                          "lat": points["lat"].to_numpy(),
+                          "long": points["long"].to_numpy(),
+                          color: points[color].to_numpy()})
+
+    out = cells.groupby(["ix", "iy"]).agg(lat=("lat", "mean"), long=("long", "mean"), nb_accidents=("lat", "size"))
+    # modalité la plus fréquente dans chaque cellule
+    dominant = (count_by(cells, ["ix", "iy", color], "n")
+                     .sort_values("n", ascending=False, kind="stable")
+                     .drop_duplicates(["ix", "iy"])
+                     .set_index(["ix", "iy"])[color])
+    out[color] = dominant
+    return out.reset_index(drop=True)
+
+
+def carte(color, an, mois, jour, catr, cbsm, atm, niveau=None, window=None, points=None):
+        color = unlist(color)
+        if niveau is None:
+            niveau = grid_level()
+        # seuls les accidents de la zone visible comptent pour le choix entre points bruts et grille:
+        # en zoomant sur une petite zone on retrouve les points et leurs popups
+        if points is None:
+            points = carte_points(an, mois, jour, catr, cbsm, atm, window)
+
+        if len(points) <= carte_max_points:
+            map = px.scatter_mapbox(points,#select_data(data,selection=select), 
+                                lat="lat", 
+                                lon="long", 
+                                mapbox_style="carto-positron", 
+                                center={"lat":46.6031, 'lon':1.8883},
+                                zoom=carte_zoom,
+                                custom_data=["date","hrmn","trajet", "int", "lum", 'com_name'],
+                                color=color,
+                                #color_discrete_sequence=color_select(unlist(color)),
+                                color_discrete_map = {'Blessé léger':'#6495ed', 'Blessé hospitalisé':'#ffa54f', 'Tué':'#ff6666', 'Indemne':'#4cae4c'},
+                                height=700,
+                                width=1000
+                                )
+            
+            map.update_traces(hovertemplate="<br>".join(["Date : %{customdata[0]}", 
+                                                    "Heure : %{customdata[1]}", 
+                                                    "Type de trajet : %{customdata[2]}", 
+                                                    "Intersection: %{customdata[3]}", 
+                                                    "Conditions d'éclairage: %{customdata[4]}",
+                                                    "Nom commune: %{customdata[5]}"]))
+            legend_title = carte_legend_title[color]
+        else:
+            # trop de points: on envoie une bulle par cellule de la grille, colorée par la modalité dominante
+            map = px.scatter_mapbox(bin_points(points, color, niveau),
+                                lat="lat", 
+                                lon="long", 
+                                mapbox_style="carto-positron", 
+                                center={"lat":46.6031, 'lon':1.8883},
+                                zoom=carte_zoom,
+                                size="nb_accidents",
+                                size_max=25,
+                                custom_data=["nb_accidents", color],
+                                color=color,
+                                color_discrete_map = {'Blessé léger':'#6495ed', 'Blessé hospitalisé':'#ffa54f', 'Tué':'#ff6666', 'Indemne':'#4cae4c'},
+                                height=700,
+                                width=1000
+                                )
+
+            map.update_traces(hovertemplate="<br>".join(["Nombre d'accidents : %{customdata[0]}", 
+                                                    "Modalité dominante : %{customdata[1]}"]))
+            legend_title = carte_legend_title[color] + "<br>(modalité dominante)"
         
-        map.update_layout(legend_title_text = legend_title_selection[unlist(color)],
-                        margin={"r":0,"t":0,"l":0,"b":0}
+        map.update_layout(legend_title_text = legend_title,
+                        margin={"r":0,"t":0,"l":0,"b":0},
+                        # garde le zoom et la position de l'utilisateur quand la figure est remplacée
+                        uirevision="carte"
                         #legend={'traceorder':[1,2,3,5,4]}
                         )
         return map
@@ -894,167 +1596,139 @@ def update_hovertemplate(is_region):
                             "Ratio accidents/pistes : %{customdata[7]}"])
 
 
-def fig_dep_reg(zoom,indicateur):
+def geojson_url(name, tolerance=None):
+    """
+    Returns the url of the contours simplified with a given tolerance.
+
+    Parameters:
+    - name (string): "regions" or "departements".
+
+    - tolerance (float or None): The tolerance given by Data.geojson_tolerance, None for the initial view.
+
+    Returns:
+    string: The url of the simplified file in /assets when it has been built (python Data.py geojson), the full remote file otherwise.
+    """
+    if tolerance is None:
+        tolerance = Data.geojson_tolerance(None)
+    if not Data.local_geojson(name, tolerance):
+        return Data.geojson_sources[name]
+    file_name = Data.geojson_file(name, tolerance)
+    # la date du fichier dans l'url permet de le garder longtemps en cache navigateur
+    version = int(os.path.getmtime(os.path.join(Data.geojson_dir, file_name)))
+    return dash.get_asset_url("geojson/" + file_name) + f"?m={version}"
+
+
+# indicateurs de la carte: colonne représentée et titre de la légende
+choropleth_indicateurs = {
+    "qte_acc": ("nombre_accidents", 'Nombre d\'accidents'),
+    "tx_acc": ("ratio", 'Nombre d\'accidents<br>pour 1000 habitants'),
+    "qte_pistes": ("nombre_pistes_cyclables", 'Nombre de pistes cyclables'),
+    "tx_pistes": ("ratio_pistes", 'Nombre de pistes cyclables<br>pour 1000 habitants'),
+    "tx_acc_pistes": ("ratio_accident_piste", 'Ratio<br>Accidents/pistes cyclables'),
+}
+
+
+def fig_dep_reg(zoom,indicateur,tolerance=None):
+    # un indicateur inconnu correspond au taux d'accidents, comme dans le menu
+    colonne, titre = choropleth_indicateurs.get(indicateur, choropleth_indicateurs["tx_acc"])
+    load()
     if zoom=="reg":
-        if indicateur =="qte_acc":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_reg,
-            geojson=geojson_regions_url,
-            locations='reg',
-            featureidkey='properties.code',
-            color="nombre_accidents",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["region_name","nombre_accidents","Population","ratio","reg","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre d\'accidents')
-        elif indicateur == "qte_pistes":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_reg,
-            geojson=geojson_regions_url,
-            locations='reg',
-            featureidkey='properties.code',
-            color="nombre_pistes_cyclables",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["region_name","nombre_accidents","Population","ratio","reg","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre de pistes cyclables')
-        elif indicateur == "tx_pistes":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_reg,
-            geojson=geojson_regions_url,
-            locations='reg',
-            featureidkey='properties.code',
-            color="ratio_pistes",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["region_name","nombre_accidents","Population","ratio","reg","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre de pistes cyclables<br>pour 1000 habitants')
-        elif indicateur == "tx_acc_pistes":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_reg,
-            geojson=geojson_regions_url,
-            locations='reg',
-            featureidkey='properties.code',
-            color="ratio_accident_piste",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["region_name","nombre_accidents","Population","ratio","reg","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Ratio<br>Accidents/pistes cyclables')
-        else:
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_reg,
-            geojson=geojson_regions_url,
-            locations='reg',
-            featureidkey='properties.code',
-            color="ratio",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["region_name","nombre_accidents","Population","ratio","reg","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre d\'accidents<br>pour 1000 habitants')
+        fig = px.choropleth_mapbox(
+        data_frame=accidents_par_reg,
+        geojson=geojson_url("regions", tolerance),
+        locations='reg',
+        featureidkey='properties.code',
+        color=colonne,
+        color_continuous_scale="Reds",
+        mapbox_style="carto-positron",
+        center={"lat": 46.7111, "lon": 1.7191},
+        opacity=0.5,
+        zoom=5,
+        custom_data=["region_name","nombre_accidents","Population","ratio","reg","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
+        )
         fig.update_traces(hovertemplate=update_hovertemplate(True))
 
     else:
-        if indicateur == "qte_acc":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_dep,
-            geojson=geojson_departements_url,
-            locations='dep',
-            featureidkey='properties.code',
-            color="nombre_accidents",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            # on centre sur la france
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["dep_name","dep","nombre_accidents","Population","ratio","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre d\'accidents')
-        elif indicateur == "qte_pistes":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_dep,
-            geojson=geojson_departements_url,
-            locations='dep',
-            featureidkey='properties.code',
-            color="nombre_pistes_cyclables",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            # on centre sur la france
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["dep_name","dep","nombre_accidents","Population","ratio","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre de pistes cyclables')
-        elif indicateur == "tx_pistes":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_dep,
-            geojson=geojson_departements_url,
-            locations='dep',
-            featureidkey='properties.code',
-            color="ratio_pistes",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            # on centre sur la france
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["dep_name","dep","nombre_accidents","Population","ratio","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre de pistes cyclables')
-        elif indicateur == "tx_acc_pistes":
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_dep,
-            geojson=geojson_departements_url,
-            locations='dep',
-            featureidkey='properties.code',
-            color="ratio_accident_piste",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            # on centre sur la france
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["dep_name","dep","nombre_accidents","Population","ratio","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Ratio<br>Accidents/pistes cyclables')
-        else:
-            fig = px.choropleth_mapbox(
-            data_frame=accidents_par_dep,
-            geojson=geojson_departements_url,
-            locations='dep',
-            featureidkey='properties.code',
-            color="ratio",
-            color_continuous_scale="Reds",
-            mapbox_style="carto-positron",
-            # on centre sur la france
-            center={"lat": 46.7111, "lon": 1.7191},
-            opacity=0.5,
-            zoom=5,
-            custom_data=["dep_name","dep","nombre_accidents","Population","ratio","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
-            )
-            fig.update_layout(coloraxis_colorbar_title='Nombre d\'accidents<br>pour 1000 habitants')
+        fig = px.choropleth_mapbox(
+        data_frame=accidents_par_dep,
+        geojson=geojson_url("departements", tolerance),
+        locations='dep',
+        featureidkey='properties.code',
+        color=colonne,
+        color_continuous_scale="Reds",
+        mapbox_style="carto-positron",
+        # on centre sur la france
+        center={"lat": 46.7111, "lon": 1.7191},
+        opacity=0.5,
+        zoom=5,
+        custom_data=["dep_name","dep","nombre_accidents","Population","ratio","nombre_pistes_cyclables","ratio_pistes","ratio_accident_piste"],
+        )
         fig.update_traces(hovertemplate=update_hovertemplate(False))
-    fig.update_layout(height=700,margin={"r":0,"t":0,"l":0,"b":0})
+    fig.update_layout(coloraxis_colorbar_title=titre)
+    fig.update_layout(height=700,margin={"r":0,"t":0,"l":0,"b":0},
+                      # garde le zoom et la position de l'utilisateur quand la figure est remplacée
+                      uirevision="fig_dep_reg")
 
     return fig
+
+
+# --------------------------------------------------------------------------------------------------
+# ----------------------------------------- Registre des cartes région/département -----------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# figures déjà construites par (niveau, indicateur, tolérance des contours)
+choropleth_registry = {}
+choropleth_lock = threading.Lock()
+
+
+def choropleth(zoom, indicateur, tolerance=None):
+    """
+    Returns the region/department map from the registry, building it on first use.
+    accidents_par_dep and accidents_par_reg are static so each figure is built once per worker.
+
+    Parameters:
+    - zoom (string): The geographic level, "reg" or "dep".
+
+    - indicateur (string): The indicator selected in 'dropdown_indic'.
+
+    - tolerance (float or None): The tolerance of the contours given by Data.geojson_tolerance, None for the initial view.
+
+    Returns:
+    dict: The figure as a plotly JSON dict.
+    """
+    if tolerance is None:
+        tolerance = Data.geojson_tolerance(None)
+    key = (zoom, indicateur, tolerance)
+    figure = choropleth_registry.get(key)
+    if figure is None:
+        figure = Cache.loads(Cache.dumps(fig_dep_reg(zoom, indicateur, tolerance)))
+        with choropleth_lock:
+            choropleth_registry[key] = figure
+    return figure
+
+
+def build_choropleth_registry():
+    """
+    Builds the 2 x 5 (level x indicator) maps of the initial view. Must be called once the Dash app exists (asset urls).
+    """
+    for zoom in ["reg", "dep"]:
+        for indicateur in choropleth_indicateurs:
+            choropleth(zoom, indicateur)
+
+
+def choropleth_values(zoom, indicateur, tolerance=None):
+    """
+    Returns what changes on the map when only the indicator changes, to be sent as a partial update.
+
+    Parameters:
+    - zoom (string): The geographic level, "reg" or "dep".
+
+    - indicateur (string): The indicator selected in 'dropdown_indic'.
+
+    - tolerance (float or None): The tolerance of the contours given by Data.geojson_tolerance, None for the initial view.
+
+    Returns:
+    tuple: The color values of the trace ('z') and the title of the colorbar.
+    """
+    figure = choropleth(zoom, indicateur, tolerance)
+    return figure["data"][0]["z"], figure["layout"]["coloraxis"]["colorbar"]["title"]["text"]
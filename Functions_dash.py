@@ -1,11 +1,18 @@
 import dash 
-from dash import Dash,dcc,html,callback,Input,Output,State, no_update
+import os
+import time
+import hashlib
+from dash import Dash,dcc,html,callback,Input,Output,State, no_update, ctx, Patch
 from dash.exceptions import PreventUpdate
+from flask import request
 import dash_bootstrap_components as dbc
 import pandas as pd 
 import plotly.express as px
 import Figure as fig
+import Data
 import pages as pag
+import Metrics
+from Cache import figures
 
 
 
@@ -79,6 +86,114 @@ def relayoutData_transform(relayoutData):
     return x_range, y_range
 
 
+def relayoutData_zoom(relayoutData):
+    """
+    Extracts the zoom out from a map's relayoutData object.
+
+    Parameters:
+    - relayoutData (ploty plot attribute): The element indicating the view of a map extracted by a callback function.
+
+    Returns:
+    - numeric or None: The mapbox zoom, None if relayoutData does not contain it.
+    """
+    if relayoutData is None:
+        return None
+    return relayoutData.get('mapbox.zoom')
+
+
+def relayoutData_bounds(relayoutData):
+    """
+    Extracts the visible area out from a map's relayoutData object.
+
+    Parameters:
+    - relayoutData (ploty plot attribute): The element indicating the view of a map extracted by a callback function.
+
+    Returns:
+    - list or None: [lon_min, lon_max, lat_min, lat_max] of the visible area, None if relayoutData does not contain it.
+    """
+    if relayoutData is None:
+        return None
+    corners = (relayoutData.get('mapbox._derived') or {}).get('coordinates')
+    if not corners:
+        return None
+    lon, lat = zip(*corners)
+    return [min(lon), max(lon), min(lat), max(lat)]
+
+
+def triggered_only_by(component_id):
+    """
+    Tells if the running callback was triggered by a change of the given component alone.
+    Initial calls (page load) are never considered triggered by a component.
+
+    Parameters:
+    - component_id (string): The id of the component.
+
+    Returns:
+    bool: True if component_id is the only trigger.
+    """
+    return len(ctx.triggered_prop_ids) == 1 and ctx.triggered_id == component_id
+
+
+def patch_figure(figure, layout_keys: tuple = ()):
+    """
+    Builds a partial update replacing the traces of a figure already displayed, and only the given layout entries.
+    The rest of the layout (template, colors, ...) is not sent again.
+
+    Parameters:
+    - figure (dict): The new figure as a plotly JSON dict.
+
+    - layout_keys (tuple): The layout entries that may differ from the displayed figure.
+
+    Returns:
+    Patch: The update to be returned by the callback.
+    """
+    patch = Patch()
+    patch['data'] = figure['data']
+    for key in layout_keys:
+        if key in figure['layout']:
+            patch['layout'][key] = figure['layout'][key]
+        else:
+            del patch['layout'][key]
+    return patch
+
+
+def callback_payload(app, output: str, values: dict = None, changed: tuple = ()):
+    """
+    Builds the body of the request the browser sends to '/_dash-update-component' to run a callback.
+    Used to run callbacks outside of a browser (benchmark, warmup).
+
+    Parameters:
+    - app (Dash): The application the callback is registered on.
+
+    - output (string): The key of the callback in app.callback_map, ex: 'graph1.figure'.
+
+    - values (dict): Values of the inputs and states, keyed by 'id.property'. Missing ones are None.
+
+    - changed (tuple): The 'id.property' of the inputs that triggered the callback, empty for an initial call.
+
+    Returns:
+    dict: The JSON body of the request.
+    """
+    callback = app.callback_map[output]
+    values = values or {}
+
+    def unpack(dependencies):
+        return [{'id': d['id'], 'property': d['property'], 'value': values.get(f"{d['id']}.{d['property']}")}
+                for d in dependencies]
+
+    # plusieurs sorties: la clé est de la forme '..id1.prop1...id2.prop2..'
+    if output.startswith('..'):
+        outputs = [dict(zip(('id', 'property'), o.rsplit('.', 1))) for o in output[2:-2].split('...')]
+    else:
+        outputs = dict(zip(('id', 'property'), output.rsplit('.', 1)))
+
+    return {'output': output,
+            'outputs': outputs,
+            'inputs': unpack(callback['inputs']),
+            'state': unpack(callback['state']),
+            'changedPropIds': list(changed)}
+
+
 def unpack_mods(data_obj: tuple):
     """
     Extracts the legend group of all points ploted in the graph an returns them in an array.
@@ -116,17 +231,12 @@ def get_callbacks(app):
     Input('data-store', 'data')
     )
     def update_summary_numbers(data):
-        if data != None:
-            return [
-                fig.chiffres(pd.DataFrame.from_dict(data), "nb_total"),
-                fig.chiffres(pd.DataFrame.from_dict(data), "nb_mort"),
-                fig.chiffres(pd.DataFrame.from_dict(data), "nb_hospital")
-            ]
-        else:
+        resume = fig.zone_resume(data)
+        with Metrics.phase("build"):
             return [
-                fig.chiffres(fig.data, "nb_total"),
-                fig.chiffres(fig.data, "nb_mort"),
-                fig.chiffres(fig.data, "nb_hospital")
+                fig.chiffres(resume, "nb_total"),
+                fig.chiffres(resume, "nb_mort"),
+                fig.chiffres(resume, "nb_hospital")
             ]
 # ------------------------------------------------------------------------------------------------------
 # --------------------------------- Callback des graphiques -------------------------------------------------
@@ -137,22 +247,25 @@ def get_callbacks(app):
         Input('data-store', 'data')
     )
     def update_niv_geo(niv_geo_update, data):
-        if data != None:
-            return fig.fig1(pd.DataFrame.from_dict(data),niv_geo_update)
-
-        return fig.fig1(fig.data,niv_geo_update)
+        return figures.get_or_build(("fig1", niv_geo_update, data),
+                                    lambda: fig.fig1(fig.zone_data(data),niv_geo_update))
 
         # ------------ Page 1 popup bar ------------------ 
 
-    @app.callback(
+    # exécuté dans le navigateur: ouvrir ou fermer le popover ne fait pas de requête au serveur
+    app.clientside_callback(
+        """
+        function toggle_popover(n, is_open) {
+            if (n) {
+                return !is_open;
+            }
+            return is_open;
+        }
+        """,
         Output("pistes_popover", "is_open"),
         [Input("pistes_button", "n_clicks")],
         [State("pistes_popover", "is_open")],
     )
-    def toggle_popover(n, is_open):
-        if n:
-            return not is_open
-        return is_open
     
     @app.callback(
          Output('graph_popup', 'figure'),
@@ -161,7 +274,12 @@ def get_callbacks(app):
      )
     def update_bar_popup(zone_geo, switch_value):
         indicateur = "qte" if not switch_value else "ratio"
-        return fig.bar_popup(zone_geo, indicateur)
+        figure = figures.get_or_build(("bar_popup", zone_geo, indicateur),
+                                      lambda: fig.bar_popup(zone_geo, indicateur))
+        # le switch ne change que les barres et les titres d'axes
+        if triggered_only_by('indic_switch'):
+            return patch_figure(figure, ('xaxis', 'yaxis'))
+        return figure
 
 
         # ------------ Page 1 Animation chart ------------------ 
@@ -172,10 +290,14 @@ def get_callbacks(app):
         Input('data-store', 'data')
     )
     def update_speed_animation(speed_animation, data):
-         if data != None:
-            return fig.fig2(speed_animation, pd.DataFrame.from_dict(data))
-         
-         return fig.fig2(speed_animation)
+         # la vitesse ne change que la durée des images de l'animation
+         if triggered_only_by('speed-dropdown'):
+            patch = Patch()
+            patch['layout']['updatemenus'][0]['buttons'][0]['args'][1]['frame']['duration'] = fig.animation_duration(speed_animation)
+            return patch
+
+         return figures.get_or_build(("fig2", speed_animation, data),
+                                     lambda: fig.fig2(speed_animation, fig.zone_data(data)))
 
         # ------------ Page 1 temporal serie ------------------ 
 
@@ -184,15 +306,15 @@ def get_callbacks(app):
             Input('data-store', 'data')
     )
     def update_fig3(data):
-        if data is None:
-            return fig.fig3()
-        
-        return fig.fig3(pd.DataFrame.from_dict(data))
+        return figures.get_or_build(("fig3", data),
+                                    lambda: fig.fig3(fig.zone_decomposition(data)))
         
     
-    # ------------ Page 2 Line chart ------------------ 
+    # ------------ Page 2 Line chart, bar chart et pie chart ------------------ 
     @callback(
-        Output('graph4', 'figure'),
+        [Output('graph4', 'figure'),
+         Output('graph5', 'figure'),
+         Output('graph6', 'figure')],
         [Input('variable-dropdown', 'value'),
          Input('annee-slider','value'),
          Input('graph6', 'clickData'),
@@ -200,113 +322,129 @@ def get_callbacks(app):
          Input('data-store', 'data')
         ]
     )
-    def update_density(selected_var,selected_annee, clickData, modalite_dropdown, data):
-        # Filter data based on global options
-        if data is None:
-            data_out = fig.data
-        else:
-            data_out = pd.DataFrame.from_dict(data)
-
+    def update_page2(selected_var,selected_annee, clickData, modalite_dropdown, data):
+        # un seul cube par zone et une seule sélection de ses cellules pour les trois graphiques
+        cube = fig.zone_cube(data)
+        key = (selected_var, selected_annee, data)
         # Filters data if clickData Exists
         if clickData is not None:
-            filtered_data = data_out[data_out['age_group'] == clickData['points'][0]["label"]]
-            # Only fiters this if pie chart is cliked
-            if modalite_dropdown != 'all':
-                filtered_data = filtered_data[filtered_data['grav'] == modalite_dropdown]
-            
-            return fig.density(selected_var,selected_annee, filtered_data, " " + str(clickData['points'][0]["label"]).lower())# Set title comp to the filtered value
-        
-        return fig.density(selected_var,selected_annee, data_out)
-    
-    # --------- Page 2 Bar chart ----------------------
-    @callback(
-        Output('graph5', 'figure'),
-        [Input('variable-dropdown', 'value'),
-         Input('annee-slider','value'),
-         Input('graph6', 'clickData'),
-         Input('modalite-dropdown', 'value'),
-         Input('data-store', 'data')
-        ]
-    )
-    def update_bar(selected_var,selected_annee, clickData, modalite_dropdown, data):
-        # Filter data based on global options
-        if data is None:
-            data_out = fig.data
+            age_group = clickData['points'][0]["label"]
+            # Only fiters grav if pie chart is cliked ('all' keeps every modality)
+            grav = modalite_dropdown
+            key += (age_group, modalite_dropdown)
+            title_density, title_bar = " " + str(age_group).lower(), str(age_group).lower()
         else:
-            data_out = pd.DataFrame.from_dict(data)
-
-        # Filters data if clickData Exists
-        if clickData is not None:
-            filtered_data = data_out[data_out['age_group'] == clickData['points'][0]["label"]]
-            # Only fiters this if pie chart is cliked
-            if modalite_dropdown != 'all':
-                filtered_data = filtered_data[filtered_data['grav'] == modalite_dropdown]
-
-            return fig.bar(selected_var, selected_annee, filtered_data, str(clickData['points'][0]["label"]).lower())
+            age_group = grav = title_density = title_bar = None
 
+        # cellules du cube sélectionnées une fois pour les deux graphiques (quelques recherches dichotomiques)
+        cells = fig.cube_slice(cube, selected_var, selected_annee, age_group, grav)
 
-        return fig.bar(selected_var, selected_annee, data_out)
+        density = figures.get_or_build(("density",) + key,
+                                       lambda: fig.density(selected_var, selected_annee, title_comp=title_density, age_group=age_group, grav=grav, cells=cells))# Set title comp to the filtered value
+        bar = figures.get_or_build(("bar",) + key,
+                                   lambda: fig.bar(selected_var, selected_annee, title_comp=title_bar, age_group=age_group, grav=grav, cells=cells))
 
-
-    # --------- Page 3 pie chart ----------------------
-    @callback(
-        Output('graph6', 'figure'),
-        [Input('modalite-dropdown', 'value'),
-         Input('annee-slider','value'),
-         Input('data-store', 'data')
-        ]
-    )
-    def update_pie(selected_modalite,selected_annee, data):
-        if data != None:
-            return fig.pie_age_grav(selected_modalite,selected_annee, pd.DataFrame.from_dict(data)) 
-
-        return fig.pie_age_grav(selected_modalite,selected_annee) 
-
-
-    @app.callback(
+        # le pie chart ne dépend ni de la variable ni du clic sur ses secteurs
+        triggers = set(ctx.triggered_prop_ids)
+        if triggers and triggers <= {'variable-dropdown.value', 'graph6.clickData'}:
+            pie = no_update
+        else:
+            pie = figures.get_or_build(("pie_age_grav", modalite_dropdown, selected_annee, data),
+                                       lambda: fig.pie_age_grav(modalite_dropdown, selected_annee, cube))
+
+        # le slider ne change que les courbes, les barres, les secteurs, l'axe des abscisses et le titre
+        if triggered_only_by('annee-slider'):
+            return patch_figure(density, ('xaxis', 'title')), patch_figure(bar, ('xaxis', 'title')), patch_figure(pie)
+        return density, bar, pie
+
+
+    app.clientside_callback(
+        """
+        function update_button_and_click_data(click_data, n_clicks) {
+            // Si le bouton a été cliqué, mettez à jour clickData à None et réinitialise le compteur de clics
+            var clicked = n_clicks !== null && n_clicks !== undefined;
+            var new_click_data = clicked ? null : click_data;
+            var reset_button_clicks = clicked ? null : 0;
+            // Mettez à jour la propriété 'disabled' du bouton en fonction de la valeur de clickData
+            var button_disabled = click_data === null || click_data === undefined;
+            return [button_disabled, new_click_data, reset_button_clicks];
+        }
+        """,
         [Output('reset-button', 'disabled'),
          Output('graph6', 'clickData'),
          Output('reset-button', 'n_clicks')],
         [Input('graph6', 'clickData'),
          Input('reset-button', 'n_clicks')]
     )
-    def update_button_and_click_data(click_data, n_clicks):
-        # Si le bouton a été cliqué, mettez à jour clickData à None et réinitialise le compteur de clics
-        if n_clicks is not None:
-            new_click_data = None
-            reset_button_clicks = None
-        else:
-            new_click_data = click_data
-            reset_button_clicks = 0
-    
-        # Mettez à jour la propriété 'disabled' du bouton en fonction de la valeur de clickData
-        button_disabled = click_data is None
-        return button_disabled, new_click_data, reset_button_clicks
 # ------------------------------------------------------------------------------------------------------
 # --------------------------------- Callback des cartes -------------------------------------------------
 # ------------------------------------------------------------------------------------------------------
 
     @callback(
-        Output('map', 'figure'),
+        [Output('map', 'figure'),
+         Output('map-grid', 'data')],
         [Input('dropdown_color', 'value'),
         Input('dropdown_an', 'value'),
         Input('dropdown_mois', 'value'),
         Input('dropdown_jour', 'value'),
         Input('dropdown_catr', 'value'),
         Input('dropdown_obsm', 'value'),
-        Input('dropdown_atm', 'value')]
+        Input('dropdown_atm', 'value'),
+        Input('map', 'relayoutData')],
+        [State('map-grid', 'data')]
     )
-    def update_map(color, an, mois, jour, catr, cbsm, atm):
-        return fig.carte(color, an, mois, jour, catr, cbsm, atm)
+    def update_map(color, an, mois, jour, catr, cbsm, atm, relayoutData, view):
+        zoom = relayoutData_zoom(relayoutData)
+        if zoom is None and view is not None:
+            niveau, window = view['niveau'], view['window']
+        else:
+            niveau = fig.grid_level(zoom)
+            window = fig.view_window(relayoutData_bounds(relayoutData), niveau)
+            # zone visible inconnue: toute la france est envoyée, avec des cellules pas plus fines qu'au zoom initial
+            if window is None:
+                niveau = min(niveau, fig.grid_level())
+        new_view = {'niveau': niveau, 'window': window}
+
+        # un déplacement de la carte qui ne sort pas de la fenêtre et ne change pas la taille des cellules ne renvoie rien
+        if ctx.triggered_id == 'map' and new_view == view:
+            raise PreventUpdate
+
+        points = fig.carte_points(an, mois, jour, catr, cbsm, atm, window)
+        # points bruts: la figure ne dépend pas du niveau de la grille
+        grille = niveau if len(points) > fig.carte_max_points else None
+        return figures.get_or_build(("carte", color, an, mois, jour, catr, cbsm, atm, grille, window),
+                                    lambda: fig.carte(color, an, mois, jour, catr, cbsm, atm, niveau, window, points)), new_view
 
     
     @callback(
-            Output('map_region_dep', 'figure'),
+            [Output('map_region_dep', 'figure'),
+             Output('map-region-dep-tolerance', 'data')],
             [Input('dropdown_regdep', 'value'),
-             Input('dropdown_indic','value')]
+             Input('dropdown_indic','value'),
+             Input('map_region_dep', 'relayoutData')],
+            [State('map-region-dep-tolerance', 'data')]
     )
-    def update_map(zoom_update,indic_update):
-        return fig.fig_dep_reg(zoom_update,indic_update)
+    def update_map(zoom_update,indic_update, relayoutData, tolerance):
+        map_zoom = relayoutData_zoom(relayoutData)
+        if map_zoom is None and tolerance is not None:
+            new_tolerance = tolerance
+        else:
+            new_tolerance = Data.geojson_tolerance(map_zoom)
+
+        # les contours ne changent que si le zoom demande une autre simplification
+        if ctx.triggered_id == 'map_region_dep' and new_tolerance == tolerance:
+            raise PreventUpdate
+
+        # changement d'indicateur: seules les couleurs et le titre de la légende sont envoyés
+        if ctx.triggered_id == 'dropdown_indic' and tolerance is not None:
+            z, titre = fig.choropleth_values(zoom_update, indic_update, new_tolerance)
+            patch = Patch()
+            patch['data'][0]['z'] = z
+            patch['layout']['coloraxis']['colorbar']['title']['text'] = titre
+            return patch, no_update
+
+        # la figure est construite avec la tolérance enregistrée dans le store, même sans zoom dans relayoutData
+        return fig.choropleth(zoom_update, indic_update, new_tolerance), new_tolerance
 
     
 # ------------------------------------------------------------------------------------------------------
@@ -314,40 +452,53 @@ def get_callbacks(app):
 # ------------------------------------------------------------------------------------------------------
 
     # this function is used to toggle the is_open property of each Collapse
-    def toggle_collapse(n, is_open):
-        if n:
-            return not is_open
-        return is_open
-
-
-
-
+    toggle_collapse = """
+        function toggle_collapse(n, is_open) {
+            if (n) {
+                return !is_open;
+            }
+            return is_open;
+        }
+        """
 
     # this function applies the "open" class to rotate the chevron
-    def set_navitem_class(is_open):
-        if is_open:
-            return "open"
-        return ""
-
+    set_navitem_class = """
+        function set_navitem_class(is_open) {
+            if (is_open) {
+                return "open";
+            }
+            return "";
+        }
+        """
 
     for i in [1, 2]:
-        app.callback(
+        app.clientside_callback(
+            toggle_collapse,
             Output(f"submenu-{i}-collapse", "is_open"),
             [Input(f"submenu-{i}", "n_clicks")],
             [State(f"submenu-{i}-collapse", "is_open")],
-        )(toggle_collapse)
+        )
 
-        app.callback(
+        app.clientside_callback(
+            set_navitem_class,
             Output(f"submenu-{i}", "className"),
             [Input(f"submenu-{i}-collapse", "is_open")],
-        )(set_navitem_class)
+        )
 
 
 # ------------------------------------------------------------------------------------------------------
 # --------------------------------- Callback du sidebar -------------------------------------------------
 # ------------------------------------------------------------------------------------------------------
 
-    @app.callback(
+    app.clientside_callback(
+        """
+        function toggle_sidebar(n, nclick) {
+            if (n && nclick === "SHOW") {
+                return ["SIDEBAR_HIDEN", "CONTENT_STYLE1", "HIDDEN"];
+            }
+            return ["SIDEBAR_STYLE", "CONTENT_STYLE", "SHOW"];
+        }
+        """,
         [
             Output("sidebar", "className"),
             Output("page-content", "className"),
@@ -359,22 +510,6 @@ def get_callbacks(app):
             State("side_click", "data"),
         ]
     )
-    def toggle_sidebar(n, nclick):
-        if n:
-            if nclick == "SHOW":
-                sidebar_style = "SIDEBAR_HIDEN"#fig.SIDEBAR_HIDEN
-                content_style = "CONTENT_STYLE1"#fig.CONTENT_STYLE1
-                cur_nclick = "HIDDEN"
-            else:
-                sidebar_style = "SIDEBAR_STYLE"#fig.SIDEBAR_STYLE
-                content_style = "CONTENT_STYLE"#fig.CONTENT_STYLE
-                cur_nclick = "SHOW"
-        else:
-            sidebar_style = "SIDEBAR_STYLE"#fig.SIDEBAR_STYLE
-            content_style = "CONTENT_STYLE"#fig.CONTENT_STYLE
-            cur_nclick = 'SHOW'
-
-        return sidebar_style, content_style, cur_nclick
 
 # ------------------------------------------------------------------------------------------------------
 # --------------------------------- Callback selection page principal ----------------------------------
@@ -385,17 +520,17 @@ def get_callbacks(app):
     def render_page_content(pathname):
         # Page d'acceuil
         if pathname in ["/", "/page-1/1"]:
-            return pag.page_main
+            return pag.page_main()
 
         # Page avec carte
         elif pathname == "/page-1/2":
-            return pag.page_usager
+            return pag.page_usager()
         
         elif pathname == "/page-map":
-            return pag.page_map
+            return pag.page_map()
         
         elif pathname == "/page-2/2":
-            return pag.page_map_region_dep
+            return pag.page_map_region_dep()
         
         # If the user tries to reach a different page, return a 404 message
         return html.Div(
@@ -415,25 +550,24 @@ def get_callbacks(app):
     @app.callback(
     [Output('zone-selection', 'style'),
      Output('zone-selection', 'options'),
-     Output('zone-selection', 'placeholder')],
+     Output('zone-selection', 'placeholder'),
+     Output('zone-selection', 'value')],
     [Input('zone-data-filter', 'value')]
     )
     def select_geo_zone(value):
+        # la zone choisie à l'autre niveau est effacée: un même code ('01') peut désigner une région et un département
         if value != 'all':
-            all_options = {
-                'all': [],
-                'reg': dict((nb, f"{nb} {nom}") for nom, nb in zip(fig.data['region_name'].unique(), fig.data['reg'].unique())),
-                'dep': dict((nb, f"{nb} {nom}") for nom, nb in zip(fig.data['dep_name'].unique(), fig.data['dep'].unique()))
-            }
+            # options précalculées avec la hiérarchie géographique, triées par code
+            options = fig.zone_options.get(value, [])
     
             if value == "reg":
                 text = "e région"
             else:
                 text = " département"
     
-            return {'visibility': 'visible'}, all_options[value], "Sélectionnez un" + text
+            return {'visibility': 'visible'}, options, "Sélectionnez un" + text, None
     
-        return {'visibility': 'hidden'}, [], ""
+        return {'visibility': 'hidden'}, [], "", None
 
 
  # --------------------------------------------- Dropdown 2 -----------------------------------------------
@@ -444,12 +578,83 @@ def get_callbacks(app):
               Input('zone-selection', 'value')
               )
     def set_zone_geo(zone, code):
-        if zone == 'all' or code is None:
+        key = fig.zone_key(zone, code)
+        # un code absent du niveau choisi (ex: '2A' resté dans le dropdown après le passage aux régions) efface le filtre
+        if key is None or code not in fig.zone_index.get(zone, {}):
             return no_update, True
-            raise PreventUpdate
-        if len(code) == 1:
-            code = '0' + code
-        else:
-            filtered = fig.data.query(f'{zone} in @code')
-            return filtered.to_dict('records'), False
-            #return fig.select_data(fig.data, {zone : [code]}).to_dict('records'), False 
\ No newline at end of file
+        # seule la clé du filtre est stockée dans le navigateur, les données restent côté serveur
+        return key, False 
+
+
+
+# ------------------------------------------------------------------------------------------------------
+# --------------------------------- Configuration du serveur -------------------------------------------
+# ------------------------------------------------------------------------------------------------------
+
+# sorties identiques pour tous les utilisateurs à entrées égales: leurs réponses portent un ETag
+etag_outputs = {"graph_popup", "map_region_dep"}
+# taille minimale (en octets) des réponses compressées
+compress_min_size = int(os.environ.get("DASHBIKE_COMPRESS_MIN_SIZE", "1024"))
+
+
+def get_server_hooks(app):
+    """
+    Registers the hooks of the Flask server behind the Dash app.
+
+    Parameters:
+    - app (Dash): The dashboard application.
+    """
+    geojson_prefix = app.get_asset_url("geojson/")
+    update_path = app.config.requests_pathname_prefix + "_dash-update-component"
+    # change à chaque démarrage: les réponses gardées par les navigateurs ne survivent pas à une mise à jour
+    version = str(time.time()).encode()
+
+    # compression gzip/brotli des réponses au-delà de compress_min_size (si flask-compress est installé)
+    try:
+        from flask_compress import Compress
+    except ImportError:
+        Compress = None
+    if Compress is not None:
+        app.server.config.setdefault("COMPRESS_ALGORITHM", ["br", "gzip"])
+        app.server.config["COMPRESS_MIN_SIZE"] = compress_min_size
+        Compress(app.server)
+
+    def request_etag():
+        # le corps de la requête contient toutes les entrées du callback: il détermine la réponse
+        body = request.get_json(silent=True) or {}
+        outputs = body.get("outputs")
+        outputs = outputs if isinstance(outputs, list) else [outputs or {}]
+        if not any(o.get("id") in etag_outputs for o in outputs):
+            return None
+        return hashlib.sha1(version + request.get_data()).hexdigest()
+
+    @app.server.before_request
+    def not_modified():
+        # réponse déjà connue du navigateur (assets/etag_cache.js): 304 sans exécuter le callback
+        if request.path != update_path or not request.if_none_match:
+            return None
+        etag = request_etag()
+        if etag is not None and any(tag.startswith(etag) for tag in request.if_none_match.as_set()):
+            response = app.server.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        return None
+
+    @app.server.after_request
+    def tag_response(response):
+        if request.path == update_path and response.status_code == 200:
+            etag = request_etag()
+            if etag is not None:
+                response.set_etag(etag)
+        return response
+
+    @app.server.after_request
+    def cache_geojson(response):
+        # les contours simplifiés sont versionnés par leur date dans l'url: on peut les garder un an
+        if request.path.startswith(geojson_prefix):
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+        return response
+
+    # temps par phase et taille des échanges de chaque callback, exposés sur /metrics (DASHBIKE_METRICS=1)
+    Metrics.register(app, extra={"figure_cache": figures.stats})
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+import numpy as np
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Configuration ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# mesures activées par DASHBIKE_METRICS=1: désactivées, aucun hook n'est enregistré et timed ne fait rien
+enabled = os.environ.get("DASHBIKE_METRICS", "0") not in ("", "0", "false")
+# nombre de requêtes conservées par sortie pour les histogrammes glissants
+window = int(os.environ.get("DASHBIKE_METRICS_WINDOW", "1000"))
+# bornes supérieures (en ms) des classes des histogrammes
+buckets_ms = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+phases = ["prep", "build", "serialize", "dispatch"]
+
+_local = threading.local()
+_samples = defaultdict(lambda: deque(maxlen=window))
+_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Mesure d'une requête ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def start(output: str):
+    # début d'une requête de callback: les phases mesurées dans ce thread lui sont attribuées
+    _local.record = {"output": output, "start": time.perf_counter(), "stack": [],
+                     "phases": dict.fromkeys(phases, 0.0), "cache": None}
+
+
+def finish(request_bytes: int, response_bytes: int, status: int):
+    """
+    Closes the record of the current request and adds it to the rolling window of its output.
+    The 'dispatch' phase is the time not spent in a measured phase (dash input parsing, response encoding, ...).
+    """
+    record = getattr(_local, "record", None)
+    if record is None:
+        return
+    _local.record = None
+    total = (time.perf_counter() - record["start"]) * 1000
+    timings = record["phases"]
+    timings["dispatch"] = max(total - sum(timings.values()), 0.0)
+    sample = (total, timings, request_bytes, response_bytes, record["cache"], status)
+    with _lock:
+        _samples[record["output"]].append(sample)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Adds the time spent in the block to a phase of the current request.
+    Phases are exclusive: time spent in a nested phase is not counted in the enclosing one.
+
+    Parameters:
+    - name (string): One of 'prep', 'build' and 'serialize'.
+    """
+    record = getattr(_local, "record", None)
+    if record is None:
+        yield
+        return
+    stack = record["stack"]
+    now = time.perf_counter()
+    if stack:
+        parent, parent_start = stack[-1]
+        record["phases"][parent] += (now - parent_start) * 1000
+    stack.append((name, now))
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        _, begin = stack.pop()
+        record["phases"][name] += (now - begin) * 1000
+        if stack:
+            stack[-1] = (stack[-1][0], now)
+
+
+def timed(name: str):
+    """
+    Decorator counting the time spent in a function in a phase of the current request.
+    Returns the function unchanged when the metrics are disabled.
+    """
+    def decorator(function):
+        if not enabled:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_hit(hit: bool):
+    # une requête qui consulte plusieurs fois le cache n'est un succès que si toutes les consultations le sont
+    record = getattr(_local, "record", None)
+    if record is not None:
+        record["cache"] = hit if record["cache"] is None else record["cache"] and hit
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Agrégation ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def summarize(values):
+    """
+    Parameters:
+    - values (list): Samples of a measure, in ms or bytes.
+
+    Returns:
+    dict: Mean, percentiles and maximum of the samples.
+    """
+    values = np.asarray(values, dtype=float)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"mean": round(float(values.mean()), 3), "p50": round(float(p50), 3),
+            "p90": round(float(p90), 3), "p99": round(float(p99), 3), "max": round(float(values.max()), 3)}
+
+
+def histogram(values):
+    # nombre de requêtes par classe de durée, la dernière classe contient tout ce qui dépasse buckets_ms[-1]
+    counts = np.bincount(np.searchsorted(buckets_ms, values), minlength=len(buckets_ms) + 1)
+    labels = [f"<={b}" for b in buckets_ms] + [f">{buckets_ms[-1]}"]
+    return dict(zip(labels, counts.tolist()))
+
+
+def report():
+    """
+    Returns:
+    dict: For each callback output, the number of requests of the window, the cache hits,
+    the latency histogram, the latency of each phase and the request and response sizes.
+    """
+    with _lock:
+        samples = {output: list(values) for output, values in _samples.items()}
+
+    out = {}
+    for output, values in sorted(samples.items()):
+        totals = [s[0] for s in values]
+        cache = [s[4] for s in values if s[4] is not None]
+        out[output] = {
+            "requests": len(values),
+            "errors": sum(s[5] >= 500 for s in values),
+            "cache_hits": sum(cache),
+            "cache_misses": len(cache) - sum(cache),
+            "total_ms": summarize(totals),
+            "histogram_ms": histogram(totals),
+            "phases_ms": {p: summarize([s[1][p] for s in values]) for p in phases},
+            "request_bytes": summarize([s[2] for s in values]),
+            "response_bytes": summarize([s[3] for s in values]),
+        }
+    return out
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Serveur ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def register(app, route: str = "/metrics", extra=None):
+    """
+    Registers the request hooks and the report route on the Flask server of a Dash app. Does nothing when disabled.
+
+    Parameters:
+    - app (Dash): The dashboard application.
+
+    - route (string): The path of the report.
+
+    - extra (dict of callables): Other statistics added to the report, ex: {"figure_cache": figures.stats}.
+
+    The response size is measured after every other after_request hook, compression included,
+    whether they are registered before or after this function.
+    """
+    if not enabled:
+        return
+    from flask import request, Response
+
+    server = app.server
+    update_path = app.config.requests_pathname_prefix + "_dash-update-component"
+
+    @server.before_request
+    def start_metrics():
+        if request.path == update_path:
+            body = request.get_json(silent=True) or {}
+            start(body.get("output", "?"))
+
+    def finish_metrics(response):
+        if request.path == update_path:
+            size = response.calculate_content_length()
+            finish(request.content_length or 0,
+                   len(response.get_data()) if size is None else size,
+                   response.status_code)
+        return response
+
+    # flask exécute les after_request dans l'ordre inverse de leur enregistrement: placé en tête de liste,
+    # finish_metrics passe après les autres (compression, ETag) et mesure la réponse réellement envoyée
+    server.after_request_funcs.setdefault(None, []).insert(0, finish_metrics)
+
+    @server.teardown_request
+    def drop_metrics(exc):
+        # requête interrompue par une exception: rien n'est enregistré pour ce thread
+        _local.record = None
+
+    @server.route(route)
+    def metrics():
+        body = {"window": window, "callbacks": report()}
+        for name, stats in (extra or {}).items():
+            body[name] = stats()
+        return Response(json.dumps(body, indent=1), mimetype="application/json")
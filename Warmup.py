@@ -0,0 +1,171 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dash.development.base_component import Component
+from plotly.utils import PlotlyJSONEncoder
+import Figure as fig
+import Functions_dash as Fun
+import pages as pag
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Configuration ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# pages dont les valeurs par défaut sont préchauffées (fonctions construisant la mise en page)
+warmup_pages = {"page_main": pag.page_main,
+                "page_usager": pag.page_usager,
+                "page_map": pag.page_map,
+                "page_map_region_dep": pag.page_map_region_dep}
+# seules les sorties coûteuses à construire sont préchauffées (figures et chiffres)
+warmup_properties = ("figure", "children")
+# peu de threads pour laisser le serveur répondre pendant le préchauffage
+warmup_workers = 2
+
+progress = {"state": "idle", "total": 0, "done": 0, "failed": [], "started": None, "elapsed": None}
+_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Fonctions ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def iter_components(component):
+    # parcours en profondeur de l'arbre des composants d'une page
+    if isinstance(component, Component):
+        yield component
+        component = getattr(component, "children", None)
+    if isinstance(component, (list, tuple)):
+        for child in component:
+            yield from iter_components(child)
+    elif isinstance(component, Component):
+        yield from iter_components(component)
+
+
+def layout_values(layout):
+    """
+    Collects the values set in a layout, as the browser sends them with the first callback requests.
+
+    Parameters:
+    - layout (Dash component): The page.
+
+    Returns:
+    dict: The values keyed by 'id.property', children excluded.
+    """
+    values = {}
+    for component in iter_components(layout):
+        component_id = getattr(component, "id", None)
+        if not isinstance(component_id, str):
+            continue
+        for prop in component._prop_names:
+            value = getattr(component, prop, None)
+            if prop not in ("id", "children") and value is not None:
+                values[f"{component_id}.{prop}"] = value
+    return values
+
+
+def output_ids(key: str):
+    # clé de app.callback_map -> liste de (id, propriété) des sorties
+    return [tuple(o.rsplit(".", 1)) for o in key.strip(".").split("...")]
+
+
+def page_requests(app, layout):
+    """
+    Builds the callback requests sent when a page is displayed with its default values.
+
+    Parameters:
+    - app (Dash): The dashboard application, its callbacks already registered.
+
+    - layout (Dash component): The page.
+
+    Returns:
+    list: (callback key, JSON body) of the callbacks updating a figure or a text of the page.
+    """
+    values = layout_values(layout)
+    ids = {c.id for c in iter_components(layout) if isinstance(getattr(c, "id", None), str)}
+    requests = []
+    for key, callback in app.callback_map.items():
+        outputs = output_ids(key)
+        # les callbacks côté client n'ont pas de fonction python
+        if "callback" not in callback or not any(i in ids and p in warmup_properties for i, p in outputs):
+            continue
+        body = json.dumps(Fun.callback_payload(app, key, values), cls=PlotlyJSONEncoder)
+        requests.append((key, body))
+    return requests
+
+
+def _post(app, key: str, body: str):
+    client = app.server.test_client()
+    response = client.post(app.config.requests_pathname_prefix + "_dash-update-component",
+                           data=body, content_type="application/json")
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"{key}: {response.status_code}")
+
+
+def _run(name: str, task):
+    try:
+        task()
+    except Exception as e:
+        with _lock:
+            progress["failed"].append(f"{name}: {e}")
+    finally:
+        with _lock:
+            progress["done"] += 1
+            if progress["done"] == progress["total"]:
+                progress["state"] = "done"
+                progress["elapsed"] = round(time.time() - progress["started"], 3)
+
+
+def start(app, route: str = "/warmup", background: bool = True):
+    """
+    Fills the figure and aggregate caches in a thread pool:
+    seasonal decompositions, region/department maps, then every callback of the pages with their default values.
+    The progress is available as JSON on route.
+
+    Parameters:
+    - app (Dash): The dashboard application, its callbacks already registered.
+
+    - route (string): The path of the progress report.
+
+    - background (bool): If True the function returns immediately, otherwise it waits for every task.
+
+    Only the first call runs the warmup: later calls (notebook cell run again, ...) do nothing.
+    """
+    # la route n'est enregistrée qu'une fois: flask refuse de redéfinir une route ou d'en ajouter après la première requête
+    if "warmup_progress" not in app.server.view_functions:
+        @app.server.route(route)
+        def warmup_progress():
+            return status()
+
+    with _lock:
+        if progress["state"] != "idle":
+            return
+        progress["state"] = "running"
+
+    # la première requête enregistre les callbacks déclarés avec dash.callback dans app.callback_map
+    app.server.test_client().get(app.config.requests_pathname_prefix + "_dash-dependencies")
+
+    tasks = [("decompositions", fig.precompute_decompositions),
+             ("choropleth", fig.build_choropleth_registry)]
+    for page, layout in warmup_pages.items():
+        for key, body in page_requests(app, layout()):
+            tasks.append((f"{page}:{key}", lambda key=key, body=body: _post(app, key, body)))
+
+    with _lock:
+        progress.update(state="running", total=len(tasks), done=0, failed=[], started=time.time(), elapsed=None)
+
+    # en arrière plan, start rend la main tout de suite et les tâches s'exécutent pendant que le serveur répond
+    pool = ThreadPoolExecutor(max_workers=warmup_workers, thread_name_prefix="warmup")
+    for name, task in tasks:
+        pool.submit(_run, name, task)
+    pool.shutdown(wait=not background)
+
+
+def status():
+    """
+    Returns:
+    dict: State ('idle', 'running' or 'done'), number of tasks done out of total, failed tasks and elapsed seconds.
+    """
+    with _lock:
+        return {**progress, "failed": list(progress["failed"])}
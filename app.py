@@ -0,0 +1,174 @@
+"""
+Point d'entrée WSGI du dashboard.
+
+    gunicorn -c gunicorn.conf.py app:server
+
+Le module construit l'application une seule fois: avec preload_app (gunicorn.conf.py), les données,
+les agrégats et les caches sont chargés dans le processus maître puis partagés par les workers (copy-on-write).
+"""
+import dash
+import dash_bootstrap_components as dbc
+from dash import dcc, html
+from PIL import Image
+import warnings
+warnings.simplefilter(action='ignore', category=FutureWarning)
+import Data
+import Functions_dash as Fun
+import Warmup
+
+
+app = dash.Dash(
+    external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.FONT_AWESOME, "assets/styles.css"],suppress_callback_exceptions=True
+)
+
+# Bar noir en haut de page
+navbar = dbc.NavbarSimple(
+    children=[
+        dbc.Button("Menu", outline=True, color="secondary", className="mr-1", id="btn_sidebar"), # Bouton pour le menu
+        dbc.Popover(
+                    "CLiquez pour ranger/sortir le sidebar",
+                    target='btn_sidebar',
+                    trigger="hover",
+                    placement = "bottom"
+                 ), 
+        # Select for merge
+        dcc.Dropdown(
+                    id='zone-data-filter',
+                    options=[{"label":"Nationale","value":'all'},
+                             {"label":"Régional","value":'reg'},
+                             {"label":"Département","value":'dep'}
+                            ],
+                    value="all",
+                    searchable=False,
+                    clearable=False,
+                    ),
+        dbc.Popover([dbc.PopoverHeader("Choix de zone géographique"),
+                     dbc.PopoverBody("Vous pouvez choisir la zone géographique à visualiser pour tout le dashboard")
+                     ],
+                    target='zone-data-filter',
+                    trigger="hover",
+                    placement = "right",
+                    id="popover-zone-geo",
+                    ),
+        dcc.Dropdown(
+                    id='zone-selection',
+                    options=[],
+                    value=None,
+                    searchable=False,
+                    clearable=False,
+                    placeholder=""
+                    )
+    ],
+    brand="",
+    brand_href="#",
+    color="dark",
+    dark=True,
+    fluid=True,
+    links_left= True,
+)
+
+
+submenu_1 = [
+    html.Li(
+        # use Row and Col components to position the chevrons
+        dbc.Row(
+            [
+                dbc.Col("Visualisations"),
+                dbc.Col(
+                    html.I(className="fas fa-chevron-right me-3"),
+                    width="auto",
+                ),
+            ],
+            className="my-1",
+        ),
+        style={"cursor": "pointer"},
+        id="submenu-1",
+    ),
+    # we use the Collapse component to hide and reveal the navigation links
+    dbc.Collapse(
+        [
+            dbc.NavLink("Evolution temporelle", href="/page-1/1"),
+            dbc.NavLink("Caractéristiques des accidents", href="/page-1/2"),
+        ],
+        id="submenu-1-collapse",
+    ),
+]
+
+submenu_2 = [
+    html.Li(
+        dbc.Row(
+            [
+                dbc.Col("Cartes interactives"),
+                dbc.Col(
+                    html.I(className="fas fa-chevron-right me-3"),
+                    width="auto",
+                ),
+            ],
+            className="my-1",
+        ),
+        style={"cursor": "pointer"},
+        id="submenu-2",
+    ),
+    dbc.Collapse(
+        [
+            dbc.NavLink("Carte de la France", href="/page-map"),
+            dbc.NavLink("Carte par région/départemnt", href="/page-2/2"),
+        ],
+        id="submenu-2-collapse",
+    ),
+]
+
+
+sidebar = html.Div(
+    [
+        html.H2("DashBike", className="display-4"),
+        html.Hr(),
+        html.Img(src = Image.open("assets/accident_bike.png"),style={"width": "60%",
+                                                             "margin-bottom": '10%'}),
+        html.P(
+            "Vous trouverez ici les différentes pages du dashboard", className="lead"
+        ),
+        dbc.Nav(submenu_1 + submenu_2, vertical=True,pills=True),
+        html.Img(src=Image.open("assets/roue.png"),style={"width": "60%",
+                                                  "margin-top": '140%'}),
+    ],
+    #style=fig.SIDEBAR_STYLE,
+    className="SIDEBAR_STYLE",
+    id="sidebar",
+)
+
+
+content = html.Div(id="page-content", 
+                   #style=fig.CONTENT_STYLE,
+                   className="CONTENT_STYLE")
+
+app.layout = html.Div(
+    [
+        dcc.Store(id='side_click'),
+        dcc.Store(id='data-store', storage_type='session'),
+        dcc.Location(id="url"),
+        navbar,
+        sidebar,
+        content,
+    ],
+)
+
+
+# Fonction qui appel toute les fonctions callback qui sont dans le fichier Fonction_dash.py
+Fun.get_callbacks(app)
+# Configuration du serveur flask (en-têtes de cache, ...)
+Fun.get_server_hooks(app)
+
+# serveur flask utilisé par gunicorn
+server = app.server
+
+# contours simplifiés versionnés dans assets/geojson: sans eux, la carte région/département charge les contours complets
+if not all(Data.local_geojson(name, t) for name in Data.geojson_sources for t in Data.geojson_tolerances):
+    warnings.warn("contours simplifiés absents de assets/geojson: lancez 'python Data.py geojson' "
+                  "pour ne plus charger les contours complets depuis github")
+
+
+if __name__ == "__main__":
+    # serveur de développement: préchauffage en arrière plan (avancement sur /warmup)
+    Warmup.start(app)
+    app.run_server(debug=True)
@@ -0,0 +1,41 @@
+// Réponses des callbacks marquées d'un ETag par le serveur (voir get_server_hooks dans Functions_dash.py):
+// le navigateur les garde et renvoie leur ETag, le serveur répond 304 si elles n'ont pas changé.
+(function () {
+    var maxEntries = 50;
+    var cache = new Map();
+    var originalFetch = window.fetch.bind(window);
+
+    window.fetch = function (input, init) {
+        var url = typeof input === "string" ? input : input.url;
+        if (!init || typeof init.body !== "string" || url.indexOf("_dash-update-component") === -1) {
+            return originalFetch(input, init);
+        }
+        var key = init.body;
+        var cached = cache.get(key);
+        if (cached) {
+            var headers = new Headers(init.headers || {});
+            headers.set("If-None-Match", cached.etag);
+            init = Object.assign({}, init, {headers: headers});
+        }
+        return originalFetch(input, init).then(function (response) {
+            if (response.status === 304 && cached) {
+                // entrée la plus récemment utilisée en fin de Map
+                cache.delete(key);
+                cache.set(key, cached);
+                return new Response(cached.body, {status: 200, headers: {"Content-Type": "application/json"}});
+            }
+            var etag = response.headers.get("ETag");
+            if (!response.ok || !etag) {
+                return response;
+            }
+            return response.clone().text().then(function (body) {
+                cache.delete(key);
+                cache.set(key, {etag: etag, body: body});
+                if (cache.size > maxEntries) {
+                    cache.delete(cache.keys().next().value);
+                }
+                return response;
+            });
+        });
+    };
+})();
@@ -0,0 +1,455 @@
+"""
+Benchmark des figures et des callbacks du dashboard sur des données synthétiques.
+
+    python benchmark.py --rows 10000 100000 1000000 --repeat 20
+    python benchmark.py --rows 1000000 --import-time
+    python benchmark.py --rows 100000 1000000 --serializers
+
+Pour chaque taille, une table d'accidents synthétique au format de accidents-velos_clean.csv est générée,
+puis mesurée dans un processus séparé (les données sont chargées une fois par processus, par Figure.load).
+Les résultats (percentiles de latence, pic mémoire, taille des réponses) sont ajoutés à benchmark_results.jsonl,
+une ligne par mesure, pour pouvoir comparer deux versions du code.
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import Data
+
+
+results_file = "benchmark_results.jsonl"
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Données synthétiques ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+# modalités (et poids) des variables qualitatives
+modalites = {
+    "grav": (["Indemne", "Blessé léger", "Blessé hospitalisé", "Tué"], [0.15, 0.5, 0.32, 0.03]),
+    "catr": (['Route Départementale', 'Voie Communales', 'Route nationale',
+              'Parc de stationnement ouvert à la circulation publique', 'Autoroute',
+              'Hors réseau public', 'Routes de métropole urbaine', 'autre'], None),
+    "obsm": (['Véhicule', 'Piéton', 'Véhicule sur rail', 'Animal domestique',
+              'Animal sauvage', 'Autre', 'Non renseigné'], [0.7, 0.03, 0.01, 0.01, 0.01, 0.04, 0.2]),
+    "atm": (['Normale', 'Temps éblouissant', 'Temps couvert', 'Brouillard - fumée', 'Pluie légère',
+             'Pluie forte', 'Vent fort - tempête', 'Neige - grêle', 'Autre'], None),
+    "situ": (["Sur chaussée", "Sur piste cyclable", "Sur bande cyclable", "Sur trottoir", "Autres"], None),
+    "trajet": (["Promenade - loisirs", "Domicile - travail", "Utilisation professionnelle",
+                "Courses - achats", "Domicile - école", "Autre"], None),
+    "sexe": (["Masculin", "Féminin"], [0.75, 0.25]),
+    "age_group": (["0-17", "18-34", "35-64", "65+"], None),
+    "lum": (["Plein jour", "Crépuscule ou aube", "Nuit sans éclairage public", "Nuit avec éclairage public"], None),
+    "int": (["Hors intersection", "Intersection en X", "Intersection en T", "Giratoire", "Autre intersection"], None),
+    "agg": (["En agglomération", "Hors agglomération"], None),
+}
+
+# codes région des départements d'outre mer (absents de pistes_dep.csv)
+reg_outre_mer = {"971": "1", "972": "2", "973": "3", "974": "4", "976": "6"}
+
+
+def synthetic_accidents(rows: int, seed: int = 0):
+    """
+    Generates an accident table with the columns and modalities of accidents-velos_clean.csv.
+
+    Parameters:
+    - rows (int): Number of accidents to generate.
+
+    - seed (int): Seed of the random generator.
+
+    Returns:
+    pandas DataFrame: The raw table, as read from the csv file (before Data.prepare_accidents).
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(values, p=None):
+        return np.asarray(values, dtype=object)[rng.choice(len(values), size=rows, p=p)]
+
+    # départements réels pour que les jointures avec la population et les pistes fonctionnent
+    deps = pd.read_csv("departements-region.csv", dtype=str)
+    regs = pd.read_csv("pistes_dep.csv", dtype=str)[["dep", "reg"]]
+    regs["reg"] = regs["reg"].str.split(".").str[0]
+    deps = deps.merge(regs, left_on="num_dep", right_on="dep", how="left")
+    deps["reg"] = deps["reg"].fillna(deps["num_dep"].map(reg_outre_mer))
+    i_dep = rng.integers(0, len(deps), rows)
+    communes = pd.read_csv("pistes_com.csv", dtype=str)["com_name"].to_numpy()
+
+    an = rng.integers(2005, 2022, rows)
+    mois = rng.integers(0, 12, rows)
+    jour_mois = rng.integers(1, 29, rows)
+    data = pd.DataFrame({
+        "an": an,
+        "mois": np.asarray(Data.mois_ordre, dtype=object)[mois],
+        "jour": pick(Data.jour_ordre),
+        "date": pd.Series(an).astype(str) + "-" + pd.Series(mois + 1).astype(str).str.zfill(2) + "-" + pd.Series(jour_mois).astype(str).str.zfill(2),
+        "hrmn": pd.Series(rng.integers(0, 24, rows)).astype(str).str.zfill(2) + ":" + pd.Series(rng.integers(0, 60, rows)).astype(str).str.zfill(2),
+        "dep": deps["num_dep"].to_numpy()[i_dep],
+        "dep_name": deps["dep_name"].to_numpy()[i_dep],
+        "reg": deps["reg"].astype(int).to_numpy()[i_dep],
+        "region_name": deps["region_name"].to_numpy()[i_dep],
+        "com_name": communes[rng.integers(0, len(communes), rows)],
+        "lat": rng.uniform(42.3, 51.1, rows),
+        "long": rng.uniform(-4.8, 8.2, rows),
+    })
+    for col, (values, p) in modalites.items():
+        data[col] = pick(values, p)
+    return data
+
+
+def write_synthetic(rows: int, folder: str, seed: int = 0):
+    """
+    Writes a synthetic table in folder, as a parquet cache when pyarrow is available, as a csv file otherwise.
+
+    Returns:
+    dict: The environment variables pointing Data.py to the written file.
+    """
+    data = synthetic_accidents(rows, seed)
+    csv_path = os.path.join(folder, "accidents.csv")
+    cache_path = os.path.join(folder, "accidents.parquet")
+    try:
+        Data.prepare_accidents(data.copy()).to_parquet(cache_path, index=False)
+    except ImportError:
+        data.to_csv(csv_path, index=False)
+    return {"DASHBIKE_ACCIDENTS_CSV": csv_path, "DASHBIKE_ACCIDENTS_CACHE": cache_path}
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Mesures ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def serialize(result):
+    # même encodeur que celui utilisé par dash pour les réponses
+    import plotly.io as pio
+    from plotly.utils import PlotlyJSONEncoder
+    if result is None:
+        return b""
+    if hasattr(result, "to_plotly_json") and hasattr(result, "layout"):
+        return pio.to_json(result).encode()
+    return json.dumps(result, cls=PlotlyJSONEncoder).encode()
+
+
+def measure(run, repeat: int, setup=None):
+    """
+    Times a function over several runs, then measures its peak memory in an extra traced run.
+
+    Parameters:
+    - run (callable): Function without argument returning the bytes sent to the browser.
+
+    - repeat (int): Number of timed runs.
+
+    - setup (callable or None): Function called before each run, outside of the measure (ex: clear_caches).
+
+    Returns:
+    dict: First run ('cold_ms', the uncached run when the caches are empty before the measure),
+    percentiles and mean latencies in ms, peak memory and payload size in bytes.
+    """
+    times = []
+    payload = b""
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        payload = run()
+        times.append((time.perf_counter() - start) * 1000)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"cold_ms": round(times[0], 3),
+            "p50_ms": round(float(np.percentile(times, 50)), 3),
+            "p90_ms": round(float(np.percentile(times, 90)), 3),
+            "p99_ms": round(float(np.percentile(times, 99)), 3),
+            "mean_ms": round(float(np.mean(times)), 3),
+            "peak_mem_bytes": int(peak),
+            "payload_bytes": len(payload)}
+
+
+def builders(fig):
+    """
+    Returns:
+    list: (name, function) pairs running each builder of Figure.py on the whole data.
+    """
+    data = fig.data
+    cube = fig.build_cube(data)
+    last = int(data["an"].max())
+    all_filters = ["all"] * 6
+    targets = [
+        ("fig1[nat]", lambda: fig.fig1(data, "nat")),
+        ("fig1[reg]", lambda: fig.fig1(data, "reg")),
+        ("fig1[dep]", lambda: fig.fig1(data, "dep")),
+        ("fig2", lambda: fig.fig2("normal", data)),
+        ("fig3", lambda: fig.fig3(fig.decomposition(data))),
+        ("build_cube", lambda: fig.build_cube(data) and None),
+        ("density[all,all]", lambda: fig.density("all", 2004, cube)),
+        ("density[grav,last]", lambda: fig.density("grav", last, cube)),
+        ("bar[dep,all]", lambda: fig.bar("dep", 2004, cube)),
+        ("bar[grav,last]", lambda: fig.bar("grav", last, cube)),
+        ("pie_age_grav[all,all]", lambda: fig.pie_age_grav("all", 2004, cube)),
+        ("pie_age_grav[Tué,last]", lambda: fig.pie_age_grav("Tué", last, cube)),
+        ("carte[grav,all]", lambda: fig.carte("grav", *all_filters)),
+        ("carte[grav,last]", lambda: fig.carte("grav", [last], *all_filters[1:])),
+        ("fig_dep_reg[reg,qte_acc]", lambda: fig.fig_dep_reg("reg", "qte_acc")),
+        ("fig_dep_reg[dep,tx_acc]", lambda: fig.fig_dep_reg("dep", "tx_acc")),
+        ("bar_popup[dep,ratio]", lambda: fig.bar_popup("dep", "ratio")),
+        ("chiffres", lambda: [fig.chiffres(fig.resume_chiffres(data), r) for r in ["nb_total", "nb_mort", "nb_hospital"]]),
+    ]
+    return targets
+
+
+def builder_targets(fig):
+    """
+    Returns:
+    list: (name, function) pairs running each builder of Figure.py on the whole data, serialization included.
+    """
+    return [(name, lambda build=build: serialize(build())) for name, build in builders(fig)]
+
+
+def clear_caches(fig):
+    # oublie les figures et les agrégats par zone: la requête suivante exécute le callback de bout en bout
+    import Cache
+    Cache.figures.clear()
+    fig.decompositions.clear()
+    fig.choropleth_registry.clear()
+    for cached in (fig._zone_data, fig._zone_resume, fig._zone_cube):
+        cached.cache_clear()
+
+
+def callback_key(app, output: str):
+    # clé de app.callback_map du callback qui met à jour output ('id.property')
+    for key in app.callback_map:
+        if output in key.strip(".").split("..."):
+            return key
+    raise KeyError(output)
+
+
+def callback_targets(app, fig, Fun):
+    """
+    Returns:
+    list: (name, function) pairs posting a callback request to the Flask server, as the browser does.
+    """
+    client = app.server.test_client()
+    client.get("/")  # enregistre les callbacks globaux dans app.callback_map
+    last = int(fig.data["an"].max())
+    reg = str(fig.data["reg"].iloc[0])
+    defaults = {
+        "niv_geo_dropdown.value": "nat", "speed-dropdown.value": "normal", "indic_switch.value": False,
+        "variable-dropdown.value": "grav", "annee-slider.value": 2004, "modalite-dropdown.value": "Tué",
+        "dropdown_color.value": "grav", "dropdown_an.value": "all", "dropdown_mois.value": "all",
+        "dropdown_jour.value": "all", "dropdown_catr.value": "all", "dropdown_obsm.value": "all",
+        "dropdown_atm.value": "all", "dropdown_regdep.value": "reg", "dropdown_indic.value": "qte_acc",
+        "zone-data-filter.value": "reg", "zone-selection.value": reg,
+    }
+    zone = {"data-store.data": {"zone": "reg", "code": reg}}
+    scenarios = [
+        ("div-summary", "div-summary.children", {}, ()),
+        ("div-summary[zone]", "div-summary.children", zone, ()),
+        ("graph1[nat]", "graph1.figure", {}, ()),
+        ("graph1[dep]", "graph1.figure", {"niv_geo_dropdown.value": "dep"}, ()),
+        ("graph_popup", "graph_popup.figure", {}, ()),
+        ("graph2", "graph2.figure", {}, ()),
+        ("graph2[speed]", "graph2.figure", {"speed-dropdown.value": "x4"}, ("speed-dropdown.value",)),
+        ("graph3", "graph3.figure", {}, ()),
+        ("graph3[zone]", "graph3.figure", zone, ()),
+        ("page2", "graph4.figure", {}, ()),
+        ("page2[slider]", "graph4.figure", {"annee-slider.value": last}, ("annee-slider.value",)),
+        ("page2[click]", "graph4.figure", {"graph6.clickData": {"points": [{"label": "18-34"}]}}, ("graph6.clickData",)),
+        ("map", "map.figure", {}, ()),
+        ("map[last year]", "map.figure", {"dropdown_an.value": [last]}, ("dropdown_an.value",)),
+        ("map_region_dep", "map_region_dep.figure", {}, ()),
+        ("map_region_dep[indic]", "map_region_dep.figure", {"dropdown_indic.value": "tx_acc", "map-region-dep-tolerance.data": 0.02}, ("dropdown_indic.value",)),
+        ("zone-selection", "zone-selection.options", {}, ()),
+        ("data-store", "data-store.data", {}, ()),
+    ]
+    targets = []
+    for name, output, values, changed in scenarios:
+        body = json.dumps(Fun.callback_payload(app, callback_key(app, output), {**defaults, **values}, changed))
+
+        def run(body=body):
+            response = client.post("/_dash-update-component", data=body, content_type="application/json")
+            if response.status_code not in (200, 204):
+                raise RuntimeError(f"{response.status_code}: {response.get_data(as_text=True)[:500]}")
+            return response.get_data()
+
+        targets.append((name, run, len(body)))
+    return targets
+
+
+def run_worker(rows: int, repeat: int):
+    """
+    Measures every builder and callback on the data designated by the environment variables.
+
+    Returns:
+    list: One record per measured target.
+    """
+    import dash
+    from dash import dcc, html
+    import Figure as fig
+    import Functions_dash as Fun
+
+    # application minimale: les callbacks n'ont besoin que des composants globaux de dash.ipynb
+    app = dash.Dash(__name__, suppress_callback_exceptions=True)
+    app.layout = html.Div([dcc.Store(id="side_click"), dcc.Store(id="data-store"), dcc.Location(id="url"), html.Div(id="page-content")])
+    Fun.get_callbacks(app)
+
+    records = []
+    for name, run in builder_targets(fig):
+        records.append({"kind": "builder", "target": name, **measure(run, repeat)})
+    for name, run, request_bytes in callback_targets(app, fig, Fun):
+        # "miss": caches vidés avant chaque requête, le callback est mesuré de bout en bout;
+        # "hit": caches vidés une seule fois, cold_ms est la requête qui les remplit et les percentiles des succès du cache
+        records.append({"kind": "callback", "cache": "miss", "target": name, "request_bytes": request_bytes,
+                        **measure(run, repeat, setup=lambda: clear_caches(fig))})
+        clear_caches(fig)
+        records.append({"kind": "callback", "cache": "hit", "target": name, "request_bytes": request_bytes,
+                        **measure(run, repeat)})
+    return records
+
+
+def run_serializer_worker(repeat: int):
+    """
+    Measures the serialization of each figure type with every available plotly JSON engine.
+
+    Returns:
+    list: One record per figure and engine.
+    """
+    import plotly.io as pio
+    import Figure as fig
+
+    engines = ["json"] + (["orjson"] if importlib.util.find_spec("orjson") else [])
+    records = []
+    for name, build in builders(fig):
+        figure = build()
+        if not (hasattr(figure, "to_plotly_json") and hasattr(figure, "layout")):
+            continue
+        for engine in engines:
+            run = lambda figure=figure, engine=engine: pio.to_json(figure, engine=engine).encode()
+            records.append({"kind": "serializer", "target": name, "engine": engine, **measure(run, repeat)})
+    return records
+
+
+def run_import_worker():
+    """
+    Measures the import of the dashboard modules, each imported for the first time in this process,
+    and the loading of the data, now deferred to Figure.load.
+
+    Returns:
+    list: One record per step, in ms.
+    """
+    steps = [("import Figure", lambda: importlib.import_module("Figure")),
+             ("Figure.load", lambda: importlib.import_module("Figure").load()),
+             ("import Functions_dash", lambda: importlib.import_module("Functions_dash")),
+             ("import app", lambda: importlib.import_module("app"))]
+    records = []
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        records.append({"kind": "import", "target": name, "ms": round((time.perf_counter() - start) * 1000, 3)})
+    return records
+
+
+def parse_importtime(stderr: str, top: int = 20):
+    """
+    Extracts the slowest modules from the output of python -X importtime.
+
+    Returns:
+    list: Records of the top modules by cumulative import time, in ms.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except (ValueError, IndexError):
+            continue # ligne d'en-tête
+        modules.append({"kind": "import-module", "target": parts[2].strip(),
+                        "ms": round(cumulative_us / 1000, 3), "self_ms": round(self_us / 1000, 3)})
+    return sorted(modules, key=lambda m: m["ms"], reverse=True)[:top]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des figures et callbacks du dashboard")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="tailles des tables synthétiques (de 10k à 10M lignes)")
+    parser.add_argument("--repeat", type=int, default=20, help="nombre de mesures par cible")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=results_file, help="fichier de résultats (une ligne json par mesure)")
+    parser.add_argument("--import-time", action="store_true",
+                        help="mesure le temps d'import des modules et du chargement des données au lieu des figures")
+    parser.add_argument("--serializers", action="store_true",
+                        help="compare le temps et la taille de la sérialisation de chaque figure selon le moteur json")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # processus de mesure: une seule taille, résultats sur la dernière ligne de la sortie
+        if args.import_time:
+            print(json.dumps(run_import_worker()))
+        elif args.serializers:
+            print(json.dumps(run_serializer_worker(args.repeat)))
+        else:
+            print(json.dumps(run_worker(args.rows[0], args.repeat)))
+        return
+
+    run_info = {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version()}
+    here = os.path.dirname(os.path.abspath(__file__))
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as folder:
+            env = {**os.environ, **write_synthetic(rows, folder, args.seed)}
+            command = [sys.executable, os.path.abspath(__file__), "--worker",
+                       "--rows", str(rows), "--repeat", str(args.repeat)]
+            if args.import_time:
+                command[1:1] = ["-X", "importtime"]
+                command.append("--import-time")
+            elif args.serializers:
+                command.append("--serializers")
+            out = subprocess.run(command, cwd=here, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            sys.exit(f"échec de la mesure pour {rows} lignes:\n{out.stderr}")
+        records = json.loads(out.stdout.strip().splitlines()[-1])
+        if args.import_time:
+            records += parse_importtime(out.stderr)
+
+        with open(args.out, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps({**run_info, "rows": rows, **record}, ensure_ascii=False) + "\n")
+
+        print(f"\n{rows} lignes")
+        if args.import_time:
+            for r in records:
+                print(f"{r['kind']:<15}{r['target']:<50}{r['ms']:>10.1f} ms")
+            continue
+        print(f"{'cible':<32}{'sans cache (ms)':>16}{'p50 (ms)':>10}{'p90 (ms)':>10}{'mémoire (Mo)':>14}{'réponse (ko)':>14}")
+        for r in records:
+            label = r['target'] + (f" ({r['engine']})" if "engine" in r else "") + (f" [{r['cache']}]" if "cache" in r else "")
+            print(f"{r['kind'][0]}:{label:<30}{r['cold_ms']:>16.1f}{r['p50_ms']:>10.1f}{r['p90_ms']:>10.1f}"
+                  f"{r['peak_mem_bytes'] / 2**20:>14.1f}{r['payload_bytes'] / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Configuration gunicorn du dashboard.
+
+    gunicorn -c gunicorn.conf.py app:server
+
+L'application est importée une seule fois dans le processus maître (preload_app): le jeu de données et
+les agrégats (accidents_par_dep, cube, index des filtres, ...) y sont chargés avant l'ouverture du port,
+puis partagés par tous les workers en copy-on-write au lieu d'être recalculés dans chacun.
+Le préchauffage des figures tourne ensuite dans chaque worker, en arrière plan, sans bloquer les requêtes.
+Les callbacks passent l'essentiel de leur temps dans pandas/numpy qui libèrent le GIL:
+quelques threads par worker suffisent, et un worker par coeur utilise toute la machine.
+Les caches de figures (DASHBIKE_FIGURE_CACHE_MB, 128 Mo) et des zones (DASHBIKE_ZONE_CACHE, 128 zones)
+sont propres à chaque worker: la mémoire totale croît avec WEB_CONCURRENCY, réduisez-les sur les petites machines.
+"""
+import gc
+import os
+import multiprocessing
+
+
+bind = os.environ.get("DASHBIKE_BIND", "0.0.0.0:8050")
+preload_app = True
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("DASHBIKE_THREADS", "4"))
+# la première construction d'une figure non préchauffée peut prendre plusieurs secondes
+timeout = 120
+# redémarrage périodique des workers pour borner la croissance des caches par processus
+max_requests = 5000
+max_requests_jitter = 500
+
+
+def on_starting(server):
+    # processus maître, après l'import de app et avant l'ouverture du port: seules les données et leurs agrégats
+    # sont chargés ici, les requêtes de santé sont refusées (port fermé) plutôt que laissées sans réponse
+    import Figure
+    Figure.load()
+    # les objets chargés jusqu'ici ne sont plus parcourus par le ramasse-miettes:
+    # leurs pages mémoire ne sont pas recopiées dans chaque worker à la première collecte
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # chaque worker préchauffe ses propres caches (figures, décompositions, cartes) en arrière plan
+    # pendant qu'il répond déjà, aux requêtes de santé comme aux autres (avancement sur /warmup)
+    import app
+    import Warmup
+    Warmup.start(app.app, background=True)
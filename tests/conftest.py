@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# les modules du dashboard sont à la racine du dépôt et lisent leurs fichiers csv en chemins relatifs
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(root)
+    return root
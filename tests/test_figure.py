@@ -0,0 +1,71 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("dash")
+pytest.importorskip("plotly")
+import numpy as np
+import Figure as fig
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Serie temp simple ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+def test_fig1_years_sorted_whatever_the_row_order():
+    # années volontairement dans le désordre, comme des données non triées ou filtrées par zone
+    data = pd.DataFrame({"an": np.array([2012, 2005, 2021, 2005, 2012, 2008, 2021, 2021], dtype="int16")})
+    figure = fig.fig1(data.sample(frac=1, random_state=0), "nat")
+    x = np.asarray(figure.data[0].x)
+    assert list(x) == [2005, 2008, 2012, 2021]
+    assert list(figure.data[0].y) == [2, 1, 2, 3]
+
+
+# --------------------------------------------------------------------------------------------------
+# ------------------------------------------ Décompositions ------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+@pytest.fixture
+def synthetic_tables(monkeypatch):
+    # tables de Figure construites à partir d'accidents synthétiques, puis oubliées après le test
+    import Cache
+    import Data
+    from benchmark import synthetic_accidents
+
+    raw = synthetic_accidents(3000, seed=0)
+    monkeypatch.setattr(Data, "load_accidents", lambda *args, **kwargs: Data.prepare_accidents(raw.copy()))
+    monkeypatch.setattr(fig, "decompositions", Cache.LRUCache(maxsize=256))
+    # build_tables complète les ordres des modalités avec celles des données
+    monkeypatch.setattr(fig, "category_orders", dict(fig.category_orders))
+    yield raw
+    for name in fig.lazy_tables:
+        fig.__dict__.pop(name, None)
+    fig._loaded = False
+    for cached in (fig._zone_data, fig._zone_resume, fig._zone_cube):
+        cached.cache_clear()
+
+
+def test_decomposition_of_short_history_zone(synthetic_tables):
+    pytest.importorskip("statsmodels")
+    raw = synthetic_tables
+    # un département n'a qu'une année d'accidents: 12 mois, moins des deux cycles demandés par seasonal_decompose
+    short = raw["dep"].iloc[0]
+    raw.loc[raw["dep"] == short, "an"] = 2021
+    other = raw.loc[raw["dep"] != short, "dep"].iloc[0]
+
+    fig.precompute_decompositions()
+
+    assert None in fig.decompositions
+    assert ("dep", other) in fig.decompositions
+    # la zone courte est calculée et gardée en cache: la série observée, sans composantes
+    assert ("dep", short) in fig.decompositions
+    composantes = fig.zone_decomposition({"zone": "dep", "code": short})
+    assert len(composantes) == 12
+    assert composantes["observed"].sum() == (raw["dep"] == short).sum()
+    assert composantes[["seasonal", "trend", "resid"]].isna().all().all()
+    fig.fig3(composantes)
+
+
+def test_sexe_order_follows_declared_order(synthetic_tables):
+    # l'ordre des modalités fixe la couleur de chacune (color_discrete_map), quel que soit l'ordre des lignes
+    fig.load()
+    assert fig.category_orders["sexe"] == ["Masculin", "Féminin"]